@@ -0,0 +1,73 @@
+import os
+import asyncio
+import httpx
+from typing import Optional
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+# Shared async HTTP client for all backend modules. Both models are served
+# from router.huggingface.co, so one pool keeps keep-alive and HTTP/2
+# connections to that host reused across them.
+_client: Optional[httpx.AsyncClient] = None
+_client_lock = asyncio.Lock()
+
+# The pool size caps how many upstream calls can be in flight at once
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the shared async HTTP client, creating it on first use"""
+    global _client
+    if _client is not None:
+        return _client
+    
+    async with _client_lock:
+        if _client is None:
+            _client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30, connect=3.05),  # Fail fast on connect, allow slow generations
+                transport=httpx.AsyncHTTPTransport(
+                    retries=2,
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS
+                    )
+                )
+            )
+    return _client
+
+async def close_client():
+    """Close the shared async HTTP client"""
+    global _client
+    async with _client_lock:
+        if _client is not None:
+            await _client.aclose()
+            _client = None
+
+# Upstream failures worth retrying: timeouts, dropped connections, rate limits and 5xx
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_WAIT = 4  # seconds
+
+def is_retryable(exc: BaseException) -> bool:
+    """Return whether an upstream error is transient and safe to retry"""
+    if isinstance(exc, (httpx.TimeoutException, httpx.RemoteProtocolError)):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code in RETRYABLE_STATUS_CODES
+
+_backoff = wait_exponential_jitter(initial=0.2, max=MAX_RETRY_WAIT)
+
+def _retry_wait(retry_state) -> float:
+    """Honor a numeric Retry-After header, otherwise back off with jitter"""
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, httpx.HTTPStatusError):
+        retry_after = exc.response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), MAX_RETRY_WAIT)
+    return _backoff(retry_state)
+
+# Decorator for coroutines making a single upstream request
+retry_upstream = retry(
+    retry=retry_if_exception(is_retryable),
+    wait=_retry_wait,
+    stop=stop_after_attempt(3),
+    reraise=True
+)
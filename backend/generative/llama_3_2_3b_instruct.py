@@ -1,6 +1,43 @@
 import os
-import requests
-from typing import Optional
+import functools
+import httpx
+import orjson
+from typing import AsyncIterator, Optional
+
+from ._http import get_client, retry_upstream
+
+# Constant instructions placed before every conversation transcript
+_LLAMA_PREAMBLE = (
+    "You are chatting with a scammer. Your goal is to waste their time by responding in a convincing but vague way.\n\n"
+    "You will accept bad language, typos, and nonsensical replies.\n\n"
+    "You will not break character or reveal that you are an AI.\n\n"
+    "You are free to use any language, including slang, emojis, and internet abbreviations.\n\n"
+    "You are allowed to use humor, sarcasm, and playful responses.\n\n"
+    "You are allowed to use inaccurate information, fake names, and fictional scenarios in order to make the scammer waste time.\n\n"
+    "The goal is to make the scammer think they are making progress, while in reality you are just wasting their time.\n\n"
+    "You are allowed only to reply to the scammer's messages, not to the user.\n\n"
+    "The answer should be in the perspective of the user, not the scammer.\n\n"
+    "No prefix or suffix is needed, just the reply.\n\n"
+    "If the last message was from the scammer, you will reply as the user.\n\n"
+    "If the last message was from the user, you will continue as the user strictly!!!.\n\n"
+    "Do NOT include the prefixes \"User:\" or \"Scammer:\" in your reply.\n\n"
+    "Your reply should be natural conversational text only.\n\n"
+    "Conversation so far:\n"
+)
+
+# Rough token count of the preamble (~4 characters per token)
+PREAMBLE_TOKENS = len(_LLAMA_PREAMBLE) // 4
+
+# Speaker prefixes the model sometimes echoes at the start of a reply
+_REPLY_PREFIXES = ("User:", "Scammer:")
+
+# Request fields shared by every call; messages are filled in per request
+_PAYLOAD_TEMPLATE = {
+    "model": "meta-llama/llama-3.2-3b-instruct",
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "max_tokens": 300
+}
 
 class SecureLlamaClient:
     """Secure wrapper for Llama API calls with proper error handling"""
@@ -19,64 +56,56 @@ class SecureLlamaClient:
     
     def clean_reply(self, reply: str) -> str:
         """Clean the reply from any unwanted prefixes"""
-        if reply.startswith("User:"):
-            return reply[len("User:"):].strip()
-        elif reply.startswith("Scammer:"):
-            return reply[len("Scammer:"):].strip()
+        for prefix in _REPLY_PREFIXES:
+            if reply.startswith(prefix):
+                return reply[len(prefix):].strip()
         return reply.strip()
     
+    def clean_reply_head(self, head: str) -> str:
+        """Clean the start of a streamed reply, keeping trailing whitespace between tokens"""
+        for prefix in _REPLY_PREFIXES:
+            if head.startswith(prefix):
+                return head[len(prefix):].lstrip()
+        return head.lstrip()
+    
     def convo_to_prompt(self, convo_text: str) -> str:
         """Convert conversation to a proper prompt"""
-        prompt = (
-            "You are chatting with a scammer. Your goal is to waste their time by responding in a convincing but vague way.\n\n"
-            "You will accept bad language, typos, and nonsensical replies.\n\n"
-            "You will not break character or reveal that you are an AI.\n\n"
-            "You are free to use any language, including slang, emojis, and internet abbreviations.\n\n"
-            "You are allowed to use humor, sarcasm, and playful responses.\n\n"
-            "You are allowed to use inaccurate information, fake names, and fictional scenarios in order to make the scammer waste time.\n\n"
-            "The goal is to make the scammer think they are making progress, while in reality you are just wasting their time.\n\n"
-            "You are allowed only to reply to the scammer's messages, not to the user.\n\n"
-            "The answer should be in the perspective of the user, not the scammer.\n\n"
-            "No prefix or suffix is needed, just the reply.\n\n"
-            "If the last message was from the scammer, you will reply as the user.\n\n"
-            "If the last message was from the user, you will continue as the user strictly!!!.\n\n"
-            "Do NOT include the prefixes \"User:\" or \"Scammer:\" in your reply.\n\n"
-            "Your reply should be natural conversational text only.\n\n"
-            "Conversation so far:\n"
-            f"{convo_text}"
+        return _LLAMA_PREAMBLE + convo_text
+    
+    def build_payload(self, convo_text: str) -> dict:
+        """Build the chat completion payload for a conversation"""
+        payload = dict(_PAYLOAD_TEMPLATE)
+        payload["messages"] = [
+            {
+                "role": "user",
+                "content": self.convo_to_prompt(convo_text)
+            }
+        ]
+        return payload
+    
+    @retry_upstream
+    async def post_completion(self, payload: dict) -> dict:
+        """Send a completion request, retrying transient upstream failures"""
+        client = await get_client()
+        response = await client.post(
+            self.api_url,
+            headers=self.headers,
+            content=orjson.dumps(payload)
         )
-        return prompt
+        response.raise_for_status()
+        return orjson.loads(response.content)
     
-    def generate_reply(self, convo_text: str) -> str:
+    async def generate_reply(self, convo_text: str) -> str:
         """Generate a reply with proper error handling and validation"""
         
-        if not convo_text or not convo_text.strip():
+        # Server input is already stripped and validated by Pydantic
+        if not convo_text:
             raise ValueError("Conversation text cannot be empty")
         
-        prompt = self.convo_to_prompt(convo_text)
-        
-        payload = {
-            "model": "meta-llama/llama-3.2-3b-instruct",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "max_tokens": 300
-        }
+        payload = self.build_payload(convo_text)
         
         try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30  # Add timeout
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = await self.post_completion(payload)
             
             if "choices" in data and len(data["choices"]) > 0:
                 reply = data["choices"][0]["message"]["content"]
@@ -84,22 +113,90 @@ class SecureLlamaClient:
             else:
                 raise ValueError(f"Unexpected response format: {data}")
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
+            raise ValueError("Request timed out")
+        except httpx.ConnectError:
+            raise ValueError("Connection error to API")
+        except httpx.HTTPStatusError as e:
+            raise ValueError(f"HTTP error: {e}")
+        except Exception as e:
+            raise ValueError(f"API request failed: {e}")
+    
+    async def stream_reply(self, convo_text: str) -> AsyncIterator[str]:
+        """Stream a reply token by token as the model generates it"""
+        
+        # Server input is already stripped and validated by Pydantic
+        if not convo_text:
+            raise ValueError("Conversation text cannot be empty")
+        
+        payload = self.build_payload(convo_text)
+        payload["stream"] = True
+        
+        # Buffer the start of the reply until a prefix can be detected and stripped
+        head = ""
+        head_done = False
+        
+        try:
+            client = await get_client()
+            async with client.stream(
+                "POST",
+                self.api_url,
+                headers=self.headers,
+                content=orjson.dumps(payload)
+            ) as response:
+                response.raise_for_status()
+                
+                async for line in response.aiter_lines():
+                    # The space after "data:" is optional in SSE
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].lstrip()
+                    if data == "[DONE]":
+                        break
+                    
+                    choices = orjson.loads(data).get("choices")
+                    if not choices:
+                        continue
+                    content = choices[0].get("delta", {}).get("content")
+                    if not content:
+                        continue
+                    
+                    if head_done:
+                        yield content
+                        continue
+                    
+                    head += content
+                    if len(head) >= len("Scammer:"):
+                        head_done = True
+                        head = self.clean_reply_head(head)
+                        if head:
+                            yield head
+            
+            if not head_done:
+                head = self.clean_reply(head)
+                if head:
+                    yield head
+                
+        except httpx.TimeoutException:
             raise ValueError("Request timed out")
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             raise ValueError("Connection error to API")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             raise ValueError(f"HTTP error: {e}")
         except Exception as e:
             raise ValueError(f"API request failed: {e}")
 
-# Create singleton instance
-_client = None
+@functools.lru_cache(maxsize=1)
+def _get_model_client() -> SecureLlamaClient:
+    """Create the client on first use and reuse it afterwards"""
+    return SecureLlamaClient()
 
-def generate_reply(convo_text: str) -> str:
+async def generate_reply(convo_text: str) -> str:
     """Public function to generate reply using singleton client"""
-    global _client
-    if _client is None:
-        _client = SecureLlamaClient()
-    
-    return _client.generate_reply(convo_text)
+    return await _get_model_client().generate_reply(convo_text)
+
+
+async def stream_reply(convo_text: str) -> AsyncIterator[str]:
+    """Public function to stream a reply using singleton client"""
+    async for token in _get_model_client().stream_reply(convo_text):
+        yield token
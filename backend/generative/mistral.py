@@ -1,7 +1,36 @@
 import os
-import requests
+import functools
+import httpx
+import orjson
 from typing import Optional
 
+from ._http import get_client, retry_upstream
+
+# Classification instructions sent as the system message on every call
+_SYSTEM_PROMPT = (
+    "You are a classification assistant for scam detection. Your job is to analyze the given input, which may be a message, "
+    "an email, or a conversation, and determine if it is potentially part of a scam.\n\n"
+
+    "You must output:\n"
+    "- A single line with comma-separated values: the first value is the main label, followed by one or more categorization tags.\n"
+    "- On a second line, provide a clear and concise explanation (1-2 sentences) for your classification decision.\n\n"
+
+    "Accepted labels are: 'Scam', 'Most Certainly Scam', 'Safe', 'Most Certainly Safe', or 'Unknown'. Avoid Unknown as much as possible\n"
+    "Tags should describe the type of content or scam (e.g., 'Phishing attempt', 'Banking', 'Investment fraud', 'Romance scam', 'Technical support', 'Unknown').\n\n"
+
+    "Output format:\n"
+    "<Label>, <Tag0>, <Tag1>, ..., <TagN>\n"
+    "<Justification>\n\n"
+
+    "No extra quotes in the before or after the words for label, tags or justification. If you are unsure about the classification, use 'Unknown' as the label and provide your best guess for tags. Be as suspicious as possible and be urgent on emotional context or situations under pressure.\n"
+    "Never break the output format. Do not include any other text beyond what is required."
+)
+
+_SYSTEM_MESSAGE = {"role": "system", "content": _SYSTEM_PROMPT}
+
+# Rough token count of the system prompt (~4 characters per token)
+SYSTEM_PROMPT_TOKENS = len(_SYSTEM_PROMPT) // 4
+
 class SecureAPIClient:
     """Secure wrapper for external API calls with proper error handling"""
     
@@ -17,35 +46,29 @@ class SecureAPIClient:
             "Content-Type": "application/json",
         }
     
-    def generate_reply(self, convo_text: str, max_new_tokens: int = 512, 
+    @retry_upstream
+    async def post_completion(self, payload: dict) -> dict:
+        """Send a completion request, retrying transient upstream failures"""
+        client = await get_client()
+        response = await client.post(
+            self.api_url,
+            headers=self.headers,
+            content=orjson.dumps(payload)
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
+    async def generate_reply(self, convo_text: str, max_new_tokens: int = 512, 
                       temperature: float = 0.7, top_p: float = 0.9) -> str:
         """Generate a classification reply with proper error handling"""
         
-        if not convo_text or not convo_text.strip():
+        # Server input is already stripped and validated by Pydantic
+        if not convo_text:
             raise ValueError("Conversation text cannot be empty")
         
-        system_prompt = (
-            "You are a classification assistant for scam detection. Your job is to analyze the given input, which may be a message, "
-            "an email, or a conversation, and determine if it is potentially part of a scam.\n\n"
-            
-            "You must output:\n"
-            "- A single line with comma-separated values: the first value is the main label, followed by one or more categorization tags.\n"
-            "- On a second line, provide a clear and concise explanation (1-2 sentences) for your classification decision.\n\n"
-
-            "Accepted labels are: 'Scam', 'Most Certainly Scam', 'Safe', 'Most Certainly Safe', or 'Unknown'. Avoid Unknown as much as possible\n"
-            "Tags should describe the type of content or scam (e.g., 'Phishing attempt', 'Banking', 'Investment fraud', 'Romance scam', 'Technical support', 'Unknown').\n\n"
-
-            "Output format:\n"
-            "<Label>, <Tag0>, <Tag1>, ..., <TagN>\n"
-            "<Justification>\n\n"
-
-            "No extra quotes in the before or after the words for label, tags or justification. If you are unsure about the classification, use 'Unknown' as the label and provide your best guess for tags. Be as suspicious as possible and be urgent on emotional context or situations under pressure.\n"
-            "Never break the output format. Do not include any other text beyond what is required."
-        )
-
         payload = {
             "messages": [
-                {"role": "system", "content": system_prompt},
+                _SYSTEM_MESSAGE,
                 {"role": "user", "content": convo_text}
             ],
             "model": "mistralai/Mistral-7B-Instruct-v0.2",
@@ -55,14 +78,7 @@ class SecureAPIClient:
         }
 
         try:
-            response = requests.post(
-                self.api_url, 
-                headers=self.headers, 
-                json=payload, 
-                timeout=30  # Add timeout
-            )
-            response.raise_for_status()
-            output = response.json()
+            output = await self.post_completion(payload)
 
             if "choices" in output and len(output["choices"]) > 0:
                 reply = output["choices"][0]["message"]["content"]
@@ -70,22 +86,20 @@ class SecureAPIClient:
             else:
                 raise ValueError(f"Unexpected response format: {output}")
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             raise ValueError("Request timed out")
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             raise ValueError("Connection error to API")
-        except requests.exceptions.HTTPError as e:
+        except httpx.HTTPStatusError as e:
             raise ValueError(f"HTTP error: {e}")
         except Exception as e:
             raise ValueError(f"API request failed: {e}")
 
-# Create singleton instance
-_client = None
+@functools.lru_cache(maxsize=1)
+def _get_model_client() -> SecureAPIClient:
+    """Create the client on first use and reuse it afterwards"""
+    return SecureAPIClient()
 
-def generate_reply(convo_text: str) -> str:
+async def generate_reply(convo_text: str) -> str:
     """Public function to generate reply using singleton client"""
-    global _client
-    if _client is None:
-        _client = SecureAPIClient()
-    
-    return _client.generate_reply(convo_text)
+    return await _get_model_client().generate_reply(convo_text)
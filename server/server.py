@@ -1,9 +1,18 @@
 import os
+import hashlib
+import hmac
 import logging
-from datetime import datetime, timedelta
-from typing import List, Literal, Optional
+import logging.handlers
+import queue
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 import asyncio
-from collections import defaultdict
+from collections import deque
+
+import orjson
+from cachetools import TTLCache
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -11,21 +20,30 @@ load_dotenv()
 
 from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field, field_validator
-from starlette.concurrency import run_in_threadpool
 import sys
 
-# Configure logging
+# Configure logging: records are formatted by the queue handler and written
+# to disk/console by a background listener thread, off the request path
+log_queue = queue.Queue(-1)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('api.log'),
-        logging.StreamHandler()
+        logging.handlers.QueueHandler(log_queue)
     ]
 )
+log_listener = logging.handlers.QueueListener(
+    log_queue,
+    # Append-only: the reloader and every worker process write to the same file,
+    # and rotating it from several processes is unsafe (use external logrotate)
+    logging.FileHandler('api.log', delay=True),
+    logging.StreamHandler()
+)
+log_listener.start()
 logger = logging.getLogger(__name__)
 
 # Environment configuration
@@ -36,11 +54,19 @@ class Config:
     MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "2000"))
     RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "10"))
     RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # seconds
+    MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "10"))
+    CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "4096"))
+    CLASSIFY_CACHE_TTL = int(os.getenv("CLASSIFY_CACHE_TTL", "3600"))  # seconds
+    MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "4096"))
 
 config = Config()
 
+# Encoded once so the constant-time comparison does not re-encode per request
+_API_KEY_BYTES = config.API_KEY.encode()
+
 # Debug: Log configuration on startup
-logger.info(f"API_KEY loaded: {config.API_KEY[:10]}...")
+logger.info(f"API_KEY loaded: {'from environment' if 'API_KEY' in os.environ else 'default placeholder'}")
 logger.info(f"ALLOWED_ORIGINS: {config.ALLOWED_ORIGINS}")
 logger.info(f"Environment file should be in: {os.path.abspath('.env')}")
 
@@ -48,8 +74,9 @@ logger.info(f"Environment file should be in: {os.path.abspath('.env')}")
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 try:
-    from backend.generative.mistral import generate_reply as predict_reply
-    from backend.generative.llama_3_2_3b_instruct import generate_reply
+    from backend.generative import _http as backend_http
+    from backend.generative.mistral import generate_reply as predict_reply, SYSTEM_PROMPT_TOKENS
+    from backend.generative.llama_3_2_3b_instruct import generate_reply, stream_reply, PREAMBLE_TOKENS
 except ImportError as e:
     logger.error(f"Failed to import backend modules: {e}")
     raise
@@ -62,47 +89,93 @@ app = FastAPI(
     redoc_url="/redoc" if os.getenv("ENVIRONMENT") == "development" else None
 )
 
+# Open the shared backend HTTP client on startup
+@app.on_event("startup")
+async def open_http_client():
+    await backend_http.get_client()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await backend_http.close_client()
+
 # Security middleware
 security = HTTPBearer()
 
 # Rate limiting
 class RateLimiter:
     def __init__(self):
-        self.requests = defaultdict(list)
-    
-    def is_allowed(self, client_ip: str) -> bool:
-        now = datetime.now()
-        # Clean old requests
-        self.requests[client_ip] = [
-            req_time for req_time in self.requests[client_ip]
-            if now - req_time < timedelta(seconds=config.RATE_LIMIT_WINDOW)
-        ]
+        # Monotonic request timestamps per IP, oldest first
+        self.requests: Dict[str, deque] = {}
+    
+    def is_allowed(self, client_ip: str, cost: int = 1) -> bool:
+        """Record `cost` requests for the IP if they all fit in the current window"""
+        timestamps = self.requests.setdefault(client_ip, deque())
+        now = time.monotonic()
+        cutoff = now - config.RATE_LIMIT_WINDOW
+        # Drop requests that fell out of the window
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
         
-        if len(self.requests[client_ip]) >= config.RATE_LIMIT_REQUESTS:
+        if len(timestamps) + cost > config.RATE_LIMIT_REQUESTS:
             return False
         
-        self.requests[client_ip].append(now)
+        timestamps.extend([now] * cost)
         return True
+    
+    def cleanup(self):
+        """Forget IPs with no requests left in the window"""
+        cutoff = time.monotonic() - config.RATE_LIMIT_WINDOW
+        for client_ip in list(self.requests):
+            timestamps = self.requests[client_ip]
+            while timestamps and timestamps[0] <= cutoff:
+                timestamps.popleft()
+            if not timestamps:
+                del self.requests[client_ip]
 
 rate_limiter = RateLimiter()
 
-# Dependency for rate limiting
-def check_rate_limit(request: Request):
+RATE_LIMIT_CLEANUP_INTERVAL = 300  # seconds
+
+async def rate_limit_janitor():
+    """Periodically evict idle IPs so the rate limiter memory stays bounded"""
+    while True:
+        await asyncio.sleep(RATE_LIMIT_CLEANUP_INTERVAL)
+        rate_limiter.cleanup()
+
+@app.on_event("startup")
+async def start_rate_limit_janitor():
+    app.state.rate_limit_janitor = asyncio.create_task(rate_limit_janitor())
+
+@app.on_event("shutdown")
+async def stop_rate_limit_janitor():
+    app.state.rate_limit_janitor.cancel()
+
+@app.on_event("shutdown")
+async def stop_log_listener():
+    # Flush queued records to the handlers before exiting
+    log_listener.stop()
+
+def enforce_rate_limit(request: Request, cost: int = 1):
+    """Charge `cost` requests to the client IP, raising 429 if that exceeds the limit (event loop only)"""
     client_ip = getattr(request.client, 'host', '127.0.0.1') if request.client else '127.0.0.1'
-    if not rate_limiter.is_allowed(client_ip):
+    if not rate_limiter.is_allowed(client_ip, cost):
         logger.warning(f"Rate limit exceeded for IP: {client_ip}")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail="Rate limit exceeded. Please try again later."
         )
 
-# Dependency for API authentication
-def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    logger.info(f"Received API key: {credentials.credentials[:10]}...") # Log first 10 chars for debugging
-    logger.info(f"Expected API key: {config.API_KEY[:10]}...")
+# Dependency for rate limiting. Async so FastAPI runs it on the event loop rather than
+# the threadpool: every limiter update then happens on one thread, like the janitor
+async def check_rate_limit(request: Request):
+    enforce_rate_limit(request)
+
+# Dependency for API authentication (async to skip the threadpool hop)
+async def verify_api_key(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    logger.debug("Received bearer token")
     
-    if credentials.credentials != config.API_KEY:
-        logger.warning(f"Invalid API key attempt. Received: {credentials.credentials[:10]}..., Expected: {config.API_KEY[:10]}...")
+    if not hmac.compare_digest(credentials.credentials.encode(), _API_KEY_BYTES):
+        logger.warning(f"Invalid API key attempt. Received: {credentials.credentials[:10]}...")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
@@ -126,13 +199,19 @@ app.add_middleware(
 # Debug middleware to log all requests
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    logger.info(f"[REQUEST] {request.method} {request.url}")
-    logger.info(f"[HEADERS] {dict(request.headers)}")
-    logger.info(f"[CLIENT] {request.client}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"[REQUEST] {request.method} {request.url}")
+        logger.info(f"[CLIENT] {request.client}")
+    if logger.isEnabledFor(logging.DEBUG):
+        headers = dict(request.headers)
+        if "authorization" in headers:
+            headers["authorization"] = "[REDACTED]"
+        logger.debug(f"[HEADERS] {headers}")
     
     response = await call_next(request)
     
-    logger.info(f"[RESPONSE] {response.status_code}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"[RESPONSE] {response.status_code}")
     return response
 
 # Pydantic models with validation
@@ -156,6 +235,9 @@ class ConversationRequest(BaseModel):
         total_length = sum(len(msg.content) for msg in v)
         if total_length > config.MAX_CONVERSATION_LENGTH:
             raise ValueError(f'Total conversation length cannot exceed {config.MAX_CONVERSATION_LENGTH} characters')
+        # Reject before calling upstream if the prompt would be too long (~4 characters per token)
+        if total_length // 4 + PREAMBLE_TOKENS > config.MAX_PROMPT_TOKENS:
+            raise ValueError(f'Conversation is too long, prompt cannot exceed {config.MAX_PROMPT_TOKENS} tokens')
         return v
 
 class EmailInput(BaseModel):
@@ -164,19 +246,36 @@ class EmailInput(BaseModel):
     @field_validator('text')
     @classmethod
     def text_must_not_be_empty(cls, v):
-        if not v.strip():
+        v = v.strip()
+        if not v:
             raise ValueError('Text cannot be empty')
-        return v.strip()
+        # Reject before calling upstream if the prompt would be too long (~4 characters per token)
+        if len(v) // 4 + SYSTEM_PROMPT_TOKENS > config.MAX_PROMPT_TOKENS:
+            raise ValueError(f'Text is too long, prompt cannot exceed {config.MAX_PROMPT_TOKENS} tokens')
+        return v
+
+# Each item is charged against the rate limit, so a batch can never exceed the per-window budget
+MAX_BATCH_ITEMS = min(config.MAX_BATCH_SIZE, config.RATE_LIMIT_REQUESTS)
+
+class BatchEmailInput(BaseModel):
+    items: List[EmailInput] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
 
 class ClassificationResponse(BaseModel):
     label: str
     tags: List[str]
     justification: str
+    error: Optional[str] = None
 
 class ReplyResponse(BaseModel):
     reply: str
     conversation_length: int
 
+class AnalysisResponse(BaseModel):
+    classification: ClassificationResponse
+    reply: Optional[str] = None
+    conversation_length: int
+    error: Optional[str] = None
+
 class HealthResponse(BaseModel):
     status: str
     timestamp: datetime
@@ -198,6 +297,81 @@ async def general_exception_handler(request: Request, exc: Exception):
         detail="Internal server error"
     )
 
+# "<Label>, <Tag0>, ..., <TagN>" on the first line, justification on the rest
+_CLASSIFY_RE = re.compile(r"^\s*([^,\n]+?)[ \t]*(?:,[ \t]*([^\n]*?))?\s*\n\s*(.+?)\s*$", re.S)
+
+def parse_classification(output: str) -> ClassificationResponse:
+    """Parse the two-line classifier output into a response model"""
+    if not output:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to generate classification"
+        )
+    
+    match = _CLASSIFY_RE.match(output)
+    if not match:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Invalid classification response format"
+        )
+    
+    prediction_label, tag_text, justification = match.groups()
+    tags = [tag.strip() for tag in tag_text.split(",")] if tag_text else []
+    
+    return ClassificationResponse(
+        label=prediction_label,
+        tags=tags,
+        justification=justification
+    )
+
+# Classification results keyed by a hash of the normalized input text
+_classification_cache = TTLCache(maxsize=config.CLASSIFY_CACHE_SIZE, ttl=config.CLASSIFY_CACHE_TTL)
+# Upstream calls currently running per key, so identical requests share one call
+_classification_inflight: Dict[bytes, asyncio.Event] = {}
+
+async def classify_text(text: str) -> ClassificationResponse:
+    """Classify text, reusing cached or in-flight results for identical input"""
+    key = hashlib.blake2b(text.strip().lower().encode(), digest_size=16).digest()
+    
+    while True:
+        cached = _classification_cache.get(key)
+        if cached is not None:
+            return cached
+        event = _classification_inflight.get(key)
+        if event is None:
+            break
+        # Another request is classifying this text; wait and re-check the cache
+        await event.wait()
+    
+    event = asyncio.Event()
+    _classification_inflight[key] = event
+    try:
+        result = parse_classification(await predict_reply(text))
+        _classification_cache[key] = result
+        return result
+    finally:
+        del _classification_inflight[key]
+        event.set()
+
+def classification_error() -> ClassificationResponse:
+    """Placeholder returned in place of a classification that failed"""
+    return ClassificationResponse(
+        label="Unknown",
+        tags=[],
+        justification="",
+        error="Failed to process classification request"
+    )
+
+# Transcript labels for each Message.role value
+_ROLE_LABEL = {"user": "User", "scammer": "Scammer"}
+
+def conversation_to_text(conversation: ConversationRequest) -> str:
+    """Convert a validated conversation into the prompt transcript"""
+    return "\n".join(
+        f"{_ROLE_LABEL[message.role]}: {message.content}"
+        for message in conversation.conversation
+    )
+
 # API Routes
 @app.post("/api/classify", response_model=ClassificationResponse)
 async def classify_email(
@@ -213,34 +387,11 @@ async def classify_email(
     try:
         logger.info(f"Classification request from {getattr(request.client, 'host', 'unknown') if request.client else 'unknown'}")
         
-        # Run AI prediction in thread pool to avoid blocking
-        output = await run_in_threadpool(predict_reply, data.text)
-        
-        if not output:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to generate classification"
-            )
-        
-        lines = output.splitlines()
-        if len(lines) < 2:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Invalid classification response format"
-            )
-        
-        labels = lines[0].split(",")
-        prediction_label = labels[0].strip()
-        tags = [tag.strip() for tag in labels[1:]] if len(labels) > 1 else []
-        justification = lines[1].strip()
+        result = await classify_text(data.text)
         
-        logger.info(f"Classification completed: {prediction_label}")
+        logger.info(f"Classification completed: {result.label}")
         
-        return ClassificationResponse(
-            label=prediction_label,
-            tags=tags,
-            justification=justification
-        )
+        return result
         
     except Exception as e:
         logger.error(f"Classification error: {e}")
@@ -249,6 +400,47 @@ async def classify_email(
             detail="Failed to process classification request"
         )
 
+@app.post("/api/classify/batch", response_model=List[ClassificationResponse])
+async def classify_batch(
+    data: BatchEmailInput,
+    request: Request,
+    _: str = Depends(verify_api_key)
+):
+    """
+    Classify several emails or messages concurrently.
+    A failed item yields an error placeholder instead of failing the batch.
+    Each item counts as one request against the rate limit.
+    Requires API key authentication.
+    """
+    # Every item may be an upstream call, so charge the whole batch up front
+    enforce_rate_limit(request, cost=len(data.items))
+    
+    logger.info(f"Batch classification request ({len(data.items)} items) from {getattr(request.client, 'host', 'unknown') if request.client else 'unknown'}")
+    
+    # Bound the number of in-flight upstream calls per batch
+    semaphore = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+    
+    async def classify_one(text: str) -> ClassificationResponse:
+        async with semaphore:
+            return await classify_text(text)
+    
+    results = await asyncio.gather(
+        *(classify_one(item.text) for item in data.items),
+        return_exceptions=True
+    )
+    
+    responses = []
+    for index, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Batch classification error for item {index}: {result}")
+            responses.append(classification_error())
+        else:
+            responses.append(result)
+    
+    logger.info(f"Batch classification completed: {len(responses)} items")
+    
+    return responses
+
 @app.post("/api/generate-reply", response_model=ReplyResponse)
 async def generate_reply_api(
     conversation: ConversationRequest,
@@ -263,14 +455,10 @@ async def generate_reply_api(
     try:
         logger.info(f"Reply generation request from {getattr(request.client, 'host', 'unknown') if request.client else 'unknown'}")
         
-        # Convert conversation to text
-        conversation_text = "\n".join([
-            f"{message.role.title()}: {message.content}"
-            for message in conversation.conversation
-        ])
+        conversation_text = conversation_to_text(conversation)
         
-        # Run AI generation in thread pool
-        reply = await run_in_threadpool(generate_reply, conversation_text)
+        # Upstream call is non-blocking, no thread pool needed
+        reply = await generate_reply(conversation_text)
         
         if not reply:
             raise HTTPException(
@@ -281,7 +469,7 @@ async def generate_reply_api(
         logger.info("Reply generation completed")
         
         return ReplyResponse(
-            reply=reply.strip(),
+            reply=reply,
             conversation_length=len(conversation_text)
         )
         
@@ -292,12 +480,109 @@ async def generate_reply_api(
             detail="Failed to process reply generation request"
         )
 
+@app.post("/api/analyze", response_model=AnalysisResponse)
+async def analyze_conversation(
+    conversation: ConversationRequest,
+    request: Request,
+    _: str = Depends(verify_api_key)
+):
+    """
+    Classify the latest message and generate a reply in one request.
+    Both upstream calls run concurrently; if one fails the other is still returned.
+    Counts as two requests against the rate limit.
+    Requires API key authentication.
+    """
+    # One classification plus one reply, charged like the batch endpoint charges per call
+    enforce_rate_limit(request, cost=2)
+    
+    logger.info(f"Analysis request from {getattr(request.client, 'host', 'unknown') if request.client else 'unknown'}")
+    
+    conversation_text = conversation_to_text(conversation)
+    
+    # The two model calls are independent, so run them side by side
+    label_task = asyncio.create_task(classify_text(conversation.conversation[-1].content))
+    reply_task = asyncio.create_task(generate_reply(conversation_text))
+    classification, reply = await asyncio.gather(label_task, reply_task, return_exceptions=True)
+    
+    if isinstance(classification, Exception) and isinstance(reply, Exception):
+        logger.error(f"Analysis error: {classification}; {reply}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process analysis request"
+        )
+    
+    error = None
+    if isinstance(classification, Exception):
+        logger.error(f"Analysis classification error: {classification}")
+        classification = classification_error()
+    if isinstance(reply, Exception) or not reply:
+        logger.error(f"Analysis reply error: {reply}")
+        reply = None
+        error = "Failed to process reply generation request"
+    
+    logger.info(f"Analysis completed: {classification.label}")
+    
+    return AnalysisResponse(
+        classification=classification,
+        reply=reply,
+        conversation_length=len(conversation_text),
+        error=error
+    )
+
+@app.post("/api/generate-reply/stream")
+async def generate_reply_stream(
+    conversation: ConversationRequest,
+    request: Request,
+    _: str = Depends(verify_api_key),
+    __: None = Depends(check_rate_limit)
+):
+    """
+    Stream a reply as server-sent events while it is being generated.
+    Each event carries {"token": ...}; the stream ends with {"done": true}
+    or {"error": ...}.
+    Requires API key authentication.
+    """
+    logger.info(f"Streaming reply request from {getattr(request.client, 'host', 'unknown') if request.client else 'unknown'}")
+    
+    conversation_text = conversation_to_text(conversation)
+    
+    async def event_generator():
+        try:
+            async for token in stream_reply(conversation_text):
+                yield b"data: " + orjson.dumps({"token": token}) + b"\n\n"
+            yield b"data: " + orjson.dumps({"done": True}) + b"\n\n"
+            logger.info("Streaming reply completed")
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.error(f"Streaming reply error: {e}")
+            yield b"data: " + orjson.dumps({"error": "Failed to process reply generation request"}) + b"\n\n"
+    
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+# Wall-clock stamp refreshed once a second for health probes
+_health_timestamp = datetime.now()
+
+async def health_clock():
+    """Keep the health timestamp current without a clock read per probe"""
+    global _health_timestamp
+    while True:
+        _health_timestamp = datetime.now()
+        await asyncio.sleep(1)
+
+@app.on_event("startup")
+async def start_health_clock():
+    app.state.health_clock = asyncio.create_task(health_clock())
+
+@app.on_event("shutdown")
+async def stop_health_clock():
+    app.state.health_clock.cancel()
+
 @app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint - no authentication required."""
     return HealthResponse(
         status="healthy",
-        timestamp=datetime.now()
+        timestamp=_health_timestamp
     )
 
 # Remove the ping endpoint for security (use health instead)
@@ -305,11 +590,22 @@ async def health_check():
 if __name__ == "__main__":
     import uvicorn
     
-    # Simple configuration for debugging
+    # Auto-reload in development; more workers are opt-in via WEB_CONCURRENCY
+    # since the rate limiter and cache are not shared between processes
+    development = os.getenv("ENVIRONMENT") == "development"
+    workers = 1 if development else int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        logger.warning(
+            f"Running {workers} workers: rate limits and the classification cache are kept per worker process"
+        )
+    
     uvicorn.run(
         "server:app",  # Use import string format 
-        host="127.0.0.1",
-        port=8000,
-        reload=True,
-        log_level="info"
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        loop="auto",  # uvloop when installed (uvicorn[standard], non-Windows)
+        http="auto",  # httptools when installed
+        reload=development,
+        workers=workers,
+        log_level=os.getenv("LOG_LEVEL", "INFO").lower()
     )
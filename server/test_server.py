@@ -0,0 +1,416 @@
+import asyncio
+import logging
+import os
+
+# Configure the server before importing it
+os.environ.setdefault("API_KEY", "test-key")
+os.environ.setdefault("HF_TOKEN_PRED", "test-token")
+os.environ.setdefault("HF_TOKEN_GEN", "test-token")
+
+import httpx
+import orjson
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from pydantic import ValidationError
+
+import server
+from server import app
+from backend.generative import _http as backend_http
+
+client = TestClient(app)
+HEADERS = {"Authorization": f"Bearer {os.environ['API_KEY']}"}
+CONVERSATION = {"conversation": [{"role": "scammer", "content": "Your account is locked, send the code"}]}
+
+
+def completion(content: str) -> httpx.Response:
+    """Build a non-streaming chat completion response"""
+    return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+
+def stream(*chunks: str, separator: str = "data: ") -> httpx.Response:
+    """Build a streaming chat completion response from content deltas"""
+    lines = [
+        separator + orjson.dumps({"choices": [{"delta": {"content": chunk}}]}).decode()
+        for chunk in chunks
+    ]
+    lines.append(separator + "[DONE]")
+    return httpx.Response(200, content="\n\n".join(lines).encode() + b"\n\n")
+
+
+class MockUpstream:
+    """Stand-in for Hugging Face routing each model's calls to a handler"""
+
+    def __init__(self, classify=None, reply=None):
+        self.handlers = {"featherless-ai": classify, "novita": reply}
+        self.calls = {"featherless-ai": 0, "novita": 0}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        provider = request.url.path.split("/")[1]
+        self.calls[provider] += 1
+        handler = self.handlers[provider]
+        if handler is None:
+            return httpx.Response(400)
+        response = handler(request)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+    @property
+    def classify_calls(self) -> int:
+        return self.calls["featherless-ai"]
+
+
+@pytest.fixture(autouse=True)
+def reset_state():
+    """Give every test an empty cache and rate limit budget"""
+    server._classification_cache.clear()
+    server.rate_limiter.requests.clear()
+    yield
+    backend_http._client = None
+
+
+def use_upstream(upstream: MockUpstream) -> MockUpstream:
+    """Route the shared backend HTTP client through a mock transport"""
+    backend_http._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    return upstream
+
+
+class TestBatchClassification:
+    def test_failed_item_yields_placeholder(self):
+        """Test one failing item does not fail the whole batch"""
+        def classify(request):
+            if b"broken" in request.content:
+                return httpx.Response(400)
+            return completion("Safe\nA normal reminder.")
+
+        use_upstream(MockUpstream(classify=classify))
+        response = client.post(
+            "/api/classify/batch",
+            json={"items": [{"text": "Dentist at 3pm"}, {"text": "broken"}]},
+            headers=HEADERS
+        )
+        assert response.status_code == 200
+        results = response.json()
+        assert results[0]["label"] == "Safe"
+        assert results[0]["error"] is None
+        assert results[1]["label"] == "Unknown"
+        assert results[1]["error"] == "Failed to process classification request"
+
+    def test_batch_at_rate_limit_succeeds(self):
+        """Test a batch of exactly the rate limit budget succeeds on a fresh budget"""
+        upstream = use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        items = [{"text": f"Message {i}"} for i in range(server.config.RATE_LIMIT_REQUESTS)]
+        response = client.post("/api/classify/batch", json={"items": items}, headers=HEADERS)
+        assert response.status_code == 200
+        assert len(response.json()) == server.config.RATE_LIMIT_REQUESTS
+        assert upstream.classify_calls == server.config.RATE_LIMIT_REQUESTS
+
+    def test_batch_above_rate_limit_rejected(self):
+        """Test a batch that could never fit in the rate limit window fails validation"""
+        upstream = use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        items = [{"text": f"Message {i}"} for i in range(server.config.RATE_LIMIT_REQUESTS + 1)]
+        response = client.post("/api/classify/batch", json={"items": items}, headers=HEADERS)
+        assert response.status_code == 422
+        assert upstream.classify_calls == 0
+
+    def test_batch_charged_per_item(self):
+        """Test a batch larger than the remaining rate limit budget is rejected"""
+        upstream = use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        response = client.post("/api/classify/batch", json={"items": [{"text": "Dentist at 3pm"}]}, headers=HEADERS)
+        assert response.status_code == 200
+        items = [{"text": f"Message {i}"} for i in range(server.config.RATE_LIMIT_REQUESTS)]
+        response = client.post("/api/classify/batch", json={"items": items}, headers=HEADERS)
+        assert response.status_code == 429
+        assert upstream.classify_calls == 1
+
+
+def stream_tokens(response) -> list:
+    """Decode the server-sent events of a streaming reply"""
+    return [
+        orjson.loads(line[len("data: "):])
+        for line in response.text.split("\n\n")
+        if line.startswith("data: ")
+    ]
+
+
+class TestStreaming:
+    def test_prefix_split_across_chunks(self):
+        """Test a speaker prefix spread over several chunks is stripped"""
+        use_upstream(MockUpstream(reply=lambda request: stream("Scam", "mer: Hel", "lo there")))
+        response = client.post("/api/generate-reply/stream", json=CONVERSATION, headers=HEADERS)
+        assert response.status_code == 200
+        events = stream_tokens(response)
+        assert "".join(event["token"] for event in events if "token" in event) == "Hello there"
+        assert events[-1] == {"done": True}
+
+    def test_data_lines_without_space(self):
+        """Test "data:" lines without a space after the colon are parsed"""
+        use_upstream(MockUpstream(reply=lambda request: stream("Hello", " there", separator="data:")))
+        response = client.post("/api/generate-reply/stream", json=CONVERSATION, headers=HEADERS)
+        events = stream_tokens(response)
+        assert "".join(event["token"] for event in events if "token" in event) == "Hello there"
+
+    def test_upstream_error_reported_in_band(self):
+        """Test an upstream failure ends the stream with an error event"""
+        use_upstream(MockUpstream(reply=lambda request: httpx.Response(400)))
+        response = client.post("/api/generate-reply/stream", json=CONVERSATION, headers=HEADERS)
+        assert response.status_code == 200
+        assert stream_tokens(response)[-1] == {"error": "Failed to process reply generation request"}
+
+
+class FakeClock:
+    """Controllable replacement for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRateLimiter:
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = FakeClock()
+        monkeypatch.setattr(server.time, "monotonic", clock)
+        monkeypatch.setattr(server.config, "RATE_LIMIT_REQUESTS", 3)
+        monkeypatch.setattr(server.config, "RATE_LIMIT_WINDOW", 60)
+        return clock
+
+    def test_limit_within_window(self, clock):
+        """Test requests beyond the limit are refused until the window passes"""
+        limiter = server.RateLimiter()
+        assert all(limiter.is_allowed("1.2.3.4") for _ in range(3))
+        assert not limiter.is_allowed("1.2.3.4")
+        assert limiter.is_allowed("5.6.7.8")
+        clock.now += 60
+        assert limiter.is_allowed("1.2.3.4")
+
+    def test_window_slides(self, clock):
+        """Test each request frees its slot one window after it was made"""
+        limiter = server.RateLimiter()
+        assert limiter.is_allowed("1.2.3.4")
+        clock.now += 30
+        assert limiter.is_allowed("1.2.3.4", cost=2)
+        clock.now += 30
+        assert limiter.is_allowed("1.2.3.4")
+        assert not limiter.is_allowed("1.2.3.4")
+
+    def test_cost_accounting(self, clock):
+        """Test a costly request is admitted only if all of it fits, and is not charged otherwise"""
+        limiter = server.RateLimiter()
+        assert limiter.is_allowed("1.2.3.4", cost=2)
+        assert not limiter.is_allowed("1.2.3.4", cost=2)
+        assert limiter.is_allowed("1.2.3.4")
+        assert not limiter.is_allowed("1.2.3.4")
+
+    def test_cleanup_forgets_idle_ips(self, clock):
+        """Test the janitor drops IPs with no requests left in the window"""
+        limiter = server.RateLimiter()
+        limiter.is_allowed("1.2.3.4")
+        clock.now += 30
+        limiter.is_allowed("5.6.7.8")
+        clock.now += 30
+        limiter.cleanup()
+        assert list(limiter.requests) == ["5.6.7.8"]
+
+    def test_endpoint_returns_429(self, clock):
+        """Test an endpoint refuses requests once the IP is over the limit"""
+        use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        statuses = [
+            client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS).status_code
+            for _ in range(4)
+        ]
+        assert statuses == [200, 200, 200, 429]
+
+
+class TestAuthentication:
+    def test_valid_key_accepted(self):
+        """Test the configured key is accepted"""
+        use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        response = client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS)
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize("key", ["wrong-key", os.environ["API_KEY"] + "x", os.environ["API_KEY"][:-1], ""])
+    def test_invalid_key_rejected(self, key):
+        """Test wrong keys, including prefixes and extensions of the real one, are rejected"""
+        upstream = use_upstream(MockUpstream())
+        response = client.post(
+            "/api/classify",
+            json={"text": "Dentist at 3pm"},
+            headers={"Authorization": f"Bearer {key}"}
+        )
+        assert response.status_code in (401, 403)
+        assert upstream.classify_calls == 0
+
+    def test_missing_key_rejected(self):
+        """Test requests without credentials are rejected"""
+        response = client.post("/api/classify", json={"text": "Dentist at 3pm"})
+        assert response.status_code in (401, 403)
+
+    def test_key_not_logged(self, caplog):
+        """Test neither accepted nor rejected attempts log the configured key"""
+        caplog.set_level(logging.DEBUG, logger="server")
+        use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS)
+        client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers={"Authorization": "Bearer wrong-key"})
+        assert "Received bearer token" in caplog.text
+        assert os.environ["API_KEY"] not in caplog.text
+
+
+class TestClassificationCache:
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_share_one_call(self):
+        """Test identical in-flight classifications make a single upstream call"""
+        async def slow_classify(request):
+            await asyncio.sleep(0.05)
+            return completion("Scam, Phishing attempt\nAsks for a code.")
+
+        upstream = use_upstream(MockUpstream(classify=slow_classify))
+        first, second = await asyncio.gather(
+            server.classify_text("Send me the code"),
+            server.classify_text("  send me THE code ")
+        )
+        assert first == second
+        assert upstream.classify_calls == 1
+
+    def test_repeated_request_served_from_cache(self):
+        """Test a repeated classification does not call upstream again"""
+        upstream = use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        for _ in range(2):
+            response = client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS)
+            assert response.status_code == 200
+        assert upstream.classify_calls == 1
+
+
+class TestParseClassification:
+    def test_label_and_tags(self):
+        """Test the first line splits into a label and tags"""
+        result = server.parse_classification("Scam, Phishing attempt, Banking\nAsks for a code.")
+        assert result.label == "Scam"
+        assert result.tags == ["Phishing attempt", "Banking"]
+        assert result.justification == "Asks for a code."
+
+    def test_multi_line_justification(self):
+        """Test every line after the first is kept as the justification"""
+        result = server.parse_classification("Scam, Phishing attempt\nAsks for a code.\nCreates urgency.")
+        assert result.justification == "Asks for a code.\nCreates urgency."
+
+    def test_blank_separator_line(self):
+        """Test a blank line between label and justification is skipped"""
+        result = server.parse_classification("Safe\n\nA normal reminder.")
+        assert result.label == "Safe"
+        assert result.tags == []
+        assert result.justification == "A normal reminder."
+
+    def test_missing_justification(self):
+        """Test output without a justification line is rejected"""
+        with pytest.raises(HTTPException) as exc_info:
+            server.parse_classification("Scam, Phishing attempt")
+        assert exc_info.value.status_code == 500
+
+    def test_missing_justification_endpoint(self):
+        """Test the classify endpoint returns 500 for unparseable output"""
+        use_upstream(MockUpstream(classify=lambda request: completion("Scam, Phishing attempt")))
+        response = client.post("/api/classify", json={"text": "Send me the code"}, headers=HEADERS)
+        assert response.status_code == 500
+
+
+class TestPromptTokenLimit:
+    def test_text_within_limit(self, monkeypatch):
+        """Test text whose estimated prompt fits the token limit is accepted"""
+        monkeypatch.setattr(server.config, "MAX_PROMPT_TOKENS", server.SYSTEM_PROMPT_TOKENS + 10)
+        assert server.EmailInput(text="a" * 40).text == "a" * 40
+
+    def test_text_over_limit(self, monkeypatch):
+        """Test text whose estimated prompt exceeds the token limit is rejected"""
+        monkeypatch.setattr(server.config, "MAX_PROMPT_TOKENS", server.SYSTEM_PROMPT_TOKENS + 10)
+        with pytest.raises(ValidationError, match="prompt cannot exceed"):
+            server.EmailInput(text="a" * 44)
+
+    def test_conversation_over_limit(self, monkeypatch):
+        """Test a conversation whose estimated prompt exceeds the token limit is rejected"""
+        monkeypatch.setattr(server.config, "MAX_PROMPT_TOKENS", server.PREAMBLE_TOKENS + 10)
+        messages = [{"role": "scammer", "content": "a" * 20}, {"role": "user", "content": "b" * 20}]
+        assert server.ConversationRequest(conversation=messages)
+        messages.append({"role": "scammer", "content": "c" * 4})
+        with pytest.raises(ValidationError, match="prompt cannot exceed"):
+            server.ConversationRequest(conversation=messages)
+
+    def test_rejected_before_upstream(self, monkeypatch):
+        """Test an over-long prompt is refused without calling upstream"""
+        monkeypatch.setattr(server.config, "MAX_PROMPT_TOKENS", server.SYSTEM_PROMPT_TOKENS + 10)
+        upstream = use_upstream(MockUpstream(classify=lambda request: completion("Safe\nA normal reminder.")))
+        response = client.post("/api/classify", json={"text": "a" * 44}, headers=HEADERS)
+        assert response.status_code == 422
+        assert upstream.classify_calls == 0
+
+
+class TestAnalyze:
+    def test_classification_failure_keeps_reply(self):
+        """Test the reply is returned when only classification fails"""
+        use_upstream(MockUpstream(
+            classify=lambda request: httpx.Response(400),
+            reply=lambda request: completion("Which code do you mean?")
+        ))
+        response = client.post("/api/analyze", json=CONVERSATION, headers=HEADERS)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["reply"] == "Which code do you mean?"
+        assert data["classification"]["error"] == "Failed to process classification request"
+        assert data["error"] is None
+
+    def test_reply_failure_keeps_classification(self):
+        """Test the classification is returned when only reply generation fails"""
+        use_upstream(MockUpstream(
+            classify=lambda request: completion("Scam, Phishing attempt\nAsks for a code."),
+            reply=lambda request: httpx.Response(400)
+        ))
+        response = client.post("/api/analyze", json=CONVERSATION, headers=HEADERS)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["classification"]["label"] == "Scam"
+        assert data["reply"] is None
+        assert data["error"] == "Failed to process reply generation request"
+
+    def test_both_failures(self):
+        """Test the request fails when both upstream calls fail"""
+        use_upstream(MockUpstream(
+            classify=lambda request: httpx.Response(400),
+            reply=lambda request: httpx.Response(400)
+        ))
+        response = client.post("/api/analyze", json=CONVERSATION, headers=HEADERS)
+        assert response.status_code == 500
+
+    def test_charged_two_requests(self, monkeypatch):
+        """Test an analysis costs two requests, one per upstream call"""
+        monkeypatch.setattr(server.config, "RATE_LIMIT_REQUESTS", 3)
+        use_upstream(MockUpstream(
+            classify=lambda request: completion("Scam, Phishing attempt\nAsks for a code."),
+            reply=lambda request: completion("Which code do you mean?")
+        ))
+        assert client.post("/api/analyze", json=CONVERSATION, headers=HEADERS).status_code == 200
+        assert client.post("/api/analyze", json=CONVERSATION, headers=HEADERS).status_code == 429
+
+
+class TestRetries:
+    @pytest.mark.parametrize("status_code", [503, 429])
+    def test_transient_errors_retried(self, status_code):
+        """Test rate limits and server errors are retried"""
+        responses = iter([
+            httpx.Response(status_code, headers={"Retry-After": "0"}),
+            httpx.Response(status_code, headers={"Retry-After": "0"}),
+            completion("Safe\nA normal reminder.")
+        ])
+        upstream = use_upstream(MockUpstream(classify=lambda request: next(responses)))
+        response = client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS)
+        assert response.status_code == 200
+        assert upstream.classify_calls == 3
+
+    def test_client_errors_not_retried(self):
+        """Test a 400 from upstream fails without retrying"""
+        upstream = use_upstream(MockUpstream(classify=lambda request: httpx.Response(400)))
+        response = client.post("/api/classify", json={"text": "Dentist at 3pm"}, headers=HEADERS)
+        assert response.status_code == 500
+        assert upstream.classify_calls == 1
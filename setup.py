@@ -6,19 +6,39 @@ Works on Windows, macOS, and Linux.
 """
 
 import os
+import io
 import sys
 import subprocess
 import platform
 import shutil
 import json
+import re
+import threading
+import time
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
+
+def _enable_windows_ansi():
+    """Turn on ANSI escape handling for the Windows console (Windows 10+)"""
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_ulong()
+        if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            kernel32.SetConsoleMode(handle, mode.value | 0x0004)  # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+    except Exception:
+        # Legacy consoles without VT support just show the raw codes
+        pass
 
 # Colors for cross-platform output
 class Colors:
-    if platform.system() == "Windows":
-        # Windows ANSI color support (Windows 10+)
-        os.system("color")
+    if platform.system() == "Windows" and sys.stdout.isatty():
+        _enable_windows_ansi()
     
     RED = '\033[91m'
     GREEN = '\033[92m'
@@ -30,8 +50,41 @@ class Colors:
     BOLD = '\033[1m'
     RESET = '\033[0m'
 
+# pip's message for a requirement it cannot resolve, e.g. "torch>=2.1.0"
+UNSATISFIED_REQUIREMENT_RE = re.compile(
+    r"(?:Could not find a version that satisfies the requirement|No matching distribution found for) (\S+)"
+)
+
+# pip output when the package index could not be reached at all
+PIP_NETWORK_ERROR_RE = re.compile(
+    r"NewConnectionError|Failed to establish a new connection|ConnectTimeoutError|ProxyError|"
+    r"Temporary failure in name resolution|Name or service not known|getaddrinfo failed|Network is unreachable"
+)
+
+# Runs in the venv interpreter and executes one pip command per stdin line (a JSON
+# argv list), so interpreter startup and pip imports are paid once for a series of installs
+PIP_WORKER_DONE_MARKER = "__SCAMSIM_PIP_DONE__"
+PIP_WORKER_SOURCE = f"""
+import json, sys
+from pip._internal.cli.main import main
+
+for line in sys.stdin:
+    try:
+        status = main(json.loads(line))
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        print(f"ERROR: {{e}}")
+        status = 1
+    print("\\n{PIP_WORKER_DONE_MARKER}", status, flush=True)
+"""
+
+# Cached version probes for system tools, reused while the binaries are unchanged
+SYSCHECK_CACHE_FILE = Path.home() / ".scamsimai" / "syscheck.json"
+SYSCHECK_CACHE_TTL = 24 * 60 * 60  # seconds
+
 class SetupManager:
-    def __init__(self):
+    def __init__(self, use_syscheck_cache: bool = True):
         # Find the actual project root by looking for key files
         current_dir = Path(__file__).parent.absolute()
         self.project_root = self._find_project_root(current_dir)
@@ -47,6 +100,26 @@ class SetupManager:
             self.venv_python = self.venv_path / "bin" / "python"
             self.venv_pip = self.venv_path / "bin" / "pip"
             self.venv_activate = self.venv_path / "bin" / "activate"
+        
+        # The venv path strings and pip argv prefix are built once and reused for every install
+        self.venv_pip_s = str(self.venv_pip)
+        self.venv_python_s = str(self.venv_python)
+        self._pip_install_prefix = (
+            self.venv_pip_s, "install",
+            "--require-virtualenv", "--prefer-binary",
+            "--disable-pip-version-check", "--no-input", "--progress-bar", "on"
+        )
+        # Child processes skip pip's self-update check, including pip runs we don't build argv for
+        self._subprocess_env = {**os.environ, "PIP_DISABLE_PIP_VERSION_CHECK": "1"}
+        
+        # Serializes console output while setup stages run in parallel
+        self._output_lock = threading.Lock()
+        # Per-thread buffer for a parallel stage's output, flushed once the stage is done
+        self._stage_output = threading.local()
+        
+        self.use_syscheck_cache = use_syscheck_cache
+        self._syscheck_cache: Optional[dict] = None
+        self._syscheck_lock = threading.Lock()
     
     def _find_project_root(self, start_path: Path) -> Path:
         """Find the project root by looking for key files/directories"""
@@ -75,26 +148,56 @@ class SetupManager:
         # Fallback to the original directory
         return start_path
     
+    def _print(self, *args, **kwargs):
+        """Print without interleaving lines from concurrently running stages"""
+        buffer = getattr(self._stage_output, "buffer", None)
+        if buffer is not None:
+            print(*args, file=buffer, **kwargs)
+            return
+        with self._output_lock:
+            print(*args, **kwargs)
+    
+    def _write(self, text: str):
+        """Write a pre-assembled block of output in one call"""
+        buffer = getattr(self._stage_output, "buffer", None)
+        if buffer is not None:
+            buffer.write(text)
+            return
+        with self._output_lock:
+            sys.stdout.write(text)
+    
+    def _run_buffered(self, stage: Callable[[], None]) -> Tuple[str, Optional[BaseException]]:
+        """Run a setup stage with its output collected, returning the output and any failure"""
+        self._stage_output.buffer = io.StringIO()
+        error = None
+        try:
+            stage()
+        except BaseException as e:  # sys.exit from a stage must not lose its output
+            error = e
+        finally:
+            output = self._stage_output.buffer.getvalue()
+            self._stage_output.buffer = None
+        return output, error
+    
     def print_step(self, step: int, message: str):
         """Print a step header"""
-        print(f"\n{Colors.BLUE}📋 Step {step}: {message}{Colors.RESET}")
-        print()
+        self._write(f"\n{Colors.BLUE}📋 Step {step}: {message}{Colors.RESET}\n\n")
     
     def print_success(self, message: str):
         """Print a success message"""
-        print(f"{Colors.GREEN}✅ {message}{Colors.RESET}")
+        self._print(f"{Colors.GREEN}✅ {message}{Colors.RESET}")
     
     def print_warning(self, message: str):
         """Print a warning message"""
-        print(f"{Colors.YELLOW}⚠️  {message}{Colors.RESET}")
+        self._print(f"{Colors.YELLOW}⚠️  {message}{Colors.RESET}")
     
     def print_error(self, message: str):
         """Print an error message"""
-        print(f"{Colors.RED}❌ {message}{Colors.RESET}")
+        self._print(f"{Colors.RED}❌ {message}{Colors.RESET}")
     
     def print_info(self, message: str):
         """Print an info message"""
-        print(f"{Colors.CYAN}💡 {message}{Colors.RESET}")
+        self._print(f"{Colors.CYAN}💡 {message}{Colors.RESET}")
     
     def run_command(self, command: List[str], cwd: Optional[Path] = None, 
                    capture_output: bool = True, check: bool = True) -> subprocess.CompletedProcess:
@@ -105,7 +208,8 @@ class SetupManager:
                 cwd=cwd or self.project_root,
                 capture_output=capture_output,
                 text=True,
-                check=check
+                check=check,
+                env=self._subprocess_env
             )
             return result
         except subprocess.CalledProcessError as e:
@@ -113,9 +217,9 @@ class SetupManager:
                 raise
             self.print_error(f"Command failed: {' '.join(command)}")
             if e.stdout:
-                print(f"stdout: {e.stdout}")
+                self._print(f"stdout: {e.stdout}")
             if e.stderr:
-                print(f"stderr: {e.stderr}")
+                self._print(f"stderr: {e.stderr}")
             raise
     
     def check_command_exists(self, command: str) -> bool:
@@ -132,6 +236,71 @@ class SetupManager:
         except Exception:
             return None
     
+    def _syscheck_cache_key(self) -> str:
+        """Key cached probes by the environment that decides which binaries run"""
+        environment = os.environ.get("PATH", "") + platform.platform() + sys.version
+        return hashlib.blake2b(environment.encode()).hexdigest()[:16]
+    
+    def _load_syscheck_cache(self) -> dict:
+        """Load the on-disk version probe cache, or an empty one"""
+        if self._syscheck_cache is None:
+            try:
+                cache = json.loads(SYSCHECK_CACHE_FILE.read_text())
+            except (OSError, ValueError):
+                cache = {}
+            with self._syscheck_lock:
+                if self._syscheck_cache is None:
+                    self._syscheck_cache = cache
+        return self._syscheck_cache
+    
+    def _save_syscheck_cache(self):
+        """Persist the version probe cache, dropping expired entries and ignoring write failures"""
+        cache = self._syscheck_cache or {}
+        # Keys change with PATH, so entries for old environments would otherwise pile up
+        cutoff = time.time() - SYSCHECK_CACHE_TTL
+        for entry_key in [key for key, entry in cache.items() if entry.get("checked_at", 0) < cutoff]:
+            del cache[entry_key]
+        try:
+            SYSCHECK_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            SYSCHECK_CACHE_FILE.write_text(json.dumps(cache, indent=2))
+        except OSError:
+            pass
+    
+    def get_cached_version(self, command: List[str], tool: str) -> Optional[str]:
+        """Get version of a command, reusing a cached result while the tool binary is unchanged"""
+        binary = shutil.which(tool)
+        if not self.use_syscheck_cache or binary is None:
+            return self.get_version(command)
+        
+        try:
+            stat = os.stat(binary)
+        except OSError:
+            return self.get_version(command)
+        
+        cache = self._load_syscheck_cache()
+        entry_key = f"{self._syscheck_cache_key()}:{' '.join(command)}"
+        entry = cache.get(entry_key)
+        if (entry
+                and entry.get("path") == binary
+                and entry.get("inode") == stat.st_ino
+                and entry.get("mtime") == stat.st_mtime
+                and time.time() - entry.get("checked_at", 0) < SYSCHECK_CACHE_TTL):
+            return entry.get("version")
+        
+        version = self.get_version(command)
+        if version:
+            # Probes may run in parallel, so update and write the cache one at a time
+            with self._syscheck_lock:
+                cache[entry_key] = {
+                    "path": binary,
+                    "inode": stat.st_ino,
+                    "mtime": stat.st_mtime,
+                    "version": version,
+                    "checked_at": time.time()
+                }
+                self._save_syscheck_cache()
+        return version
+    
     def check_python_version(self) -> Tuple[bool, str]:
         """Check if Python version meets requirements"""
         try:
@@ -173,6 +342,34 @@ class SetupManager:
         else:
             return ["npm"]
     
+    def _npm_version_fast(self, npm_cmd: List[str]) -> Optional[str]:
+        """Read npm's version from its own package.json instead of starting node"""
+        npm_path = shutil.which(npm_cmd[-1])
+        if npm_path is None:
+            return None
+        
+        npm_bin = Path(npm_path)
+        candidates = [
+            # Unix symlink into the package: <prefix>/lib/node_modules/npm/bin/npm-cli.js
+            npm_bin.resolve().parent.parent / "package.json",
+            # Unix wrapper script: <prefix>/bin/npm
+            npm_bin.parent.parent / "lib" / "node_modules" / "npm" / "package.json",
+            # Windows: npm.cmd sits next to node_modules in the Node.js install directory
+            npm_bin.parent / "node_modules" / "npm" / "package.json"
+        ]
+        for candidate in candidates:
+            try:
+                package = json.loads(candidate.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if isinstance(package, dict) and package.get("name") == "npm" and package.get("version"):
+                return package["version"]
+        return None
+    
+    def get_npm_version(self, npm_cmd: List[str]) -> Optional[str]:
+        """Get the npm version, only running npm when its package.json can't be found"""
+        return self._npm_version_fast(npm_cmd) or self.get_cached_version(npm_cmd + ["--version"], npm_cmd[-1])
+    
     def check_system_requirements(self):
         """Check all system requirements"""
         self.print_step(1, "Checking System Requirements")
@@ -188,9 +385,17 @@ class SetupManager:
             self.print_info("Download from: https://www.python.org/downloads/")
             all_good = False
         
+        # Probe node and npm versions concurrently, they are independent subprocesses
+        node_exists = self.check_command_exists("node")
+        npm_cmd = self._get_npm_command()
+        npm_exists = self.check_command_exists(npm_cmd[0])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            node_future = executor.submit(self.get_cached_version, ["node", "--version"], "node") if node_exists else None
+            npm_future = executor.submit(self.get_npm_version, npm_cmd) if npm_exists else None
+        
         # Check Node.js
-        if self.check_command_exists("node"):
-            node_version = self.get_version(["node", "--version"])
+        if node_future:
+            node_version = node_future.result()
             if node_version:
                 self.print_success(f"Node.js found: {node_version}")
             else:
@@ -201,9 +406,8 @@ class SetupManager:
             all_good = False
         
         # Check npm
-        npm_cmd = self._get_npm_command()
-        if self.check_command_exists(npm_cmd[0]):
-            npm_version = self.get_version(npm_cmd + ["--version"])
+        if npm_future:
+            npm_version = npm_future.result()
             if npm_version:
                 self.print_success(f"npm found: {npm_version}")
             else:
@@ -214,7 +418,7 @@ class SetupManager:
             all_good = False
         
         if not all_good:
-            print(f"\n{Colors.RED}❌ System requirements not met. Please install missing components.{Colors.RESET}")
+            self._print(f"\n{Colors.RED}❌ System requirements not met. Please install missing components.{Colors.RESET}")
             sys.exit(1)
     
     def setup_virtual_environment(self):
@@ -223,9 +427,15 @@ class SetupManager:
         
         # Create virtual environment
         if not self.venv_path.exists():
-            print("Creating Python virtual environment...")
-            self.run_command([sys.executable, "-m", "venv", str(self.venv_path)])
-            self.print_success("Virtual environment created")
+            self._print("Creating Python virtual environment...")
+            # --upgrade-deps upgrades pip as part of creation, no separate pip run needed
+            try:
+                self.run_command([sys.executable, "-m", "venv", "--upgrade-deps", str(self.venv_path)])
+                self.print_success("Virtual environment created")
+            except subprocess.CalledProcessError:
+                if not self.venv_python.exists():
+                    raise
+                self.print_warning("Virtual environment created but pip upgrade failed, continuing anyway")
         else:
             self.print_warning("Virtual environment already exists, skipping creation")
         
@@ -235,18 +445,28 @@ class SetupManager:
             sys.exit(1)
         
         self.print_success("Virtual environment ready")
-        
-        # Upgrade pip
-        print("Upgrading pip...")
-        try:
-            self.run_command([str(self.venv_python), "-m", "pip", "install", "--upgrade", "pip"])
-            self.print_success("pip upgraded")
-        except subprocess.CalledProcessError:
-            self.print_warning("pip upgrade failed, continuing anyway")
     
-    def _install_with_live_output(self, command: List[str], description: str, cwd: Optional[Path] = None) -> bool:
-        """Install packages with live output streaming"""
-        print(f"{Colors.CYAN}📦 {description}{Colors.RESET}")
+    def _print_install_line(self, line: str):
+        """Print one line of installer output, color coded by its content"""
+        if any(keyword in line for keyword in ["Collecting", "Found existing installation"]):
+            self._print(f"{Colors.BLUE}🔍 {line}{Colors.RESET}")
+        elif any(keyword in line for keyword in ["Downloading", "%", "progress"]):
+            self._print(f"{Colors.CYAN}⬇️  {line}{Colors.RESET}")
+        elif any(keyword in line for keyword in ["Installing", "added", "packages"]):
+            self._print(f"{Colors.GREEN}📦 {line}{Colors.RESET}")
+        elif any(keyword in line for keyword in ["Successfully installed", "up to date"]):
+            self._print(f"{Colors.GREEN}✅ {line}{Colors.RESET}")
+        elif any(keyword in line.lower() for keyword in ["error", "failed", "warn"]):
+            self._print(f"{Colors.RED}❌ {line}{Colors.RESET}")
+        elif "Requirement already satisfied" in line:
+            self._print(f"{Colors.YELLOW}✓ {line}{Colors.RESET}")
+        else:
+            self._print(f"   {line}")
+    
+    def _install_with_live_output(self, command: List[str], description: str, cwd: Optional[Path] = None,
+                                  output_lines: Optional[deque] = None) -> bool:
+        """Install packages with live output streaming, optionally collecting the lines"""
+        self._print(f"{Colors.CYAN}📦 {description}{Colors.RESET}")
         try:
             # Use Popen for real-time output streaming
             process = subprocess.Popen(
@@ -256,7 +476,8 @@ class SetupManager:
                 stderr=subprocess.STDOUT,
                 text=True,
                 bufsize=1,
-                universal_newlines=True
+                universal_newlines=True,
+                env=self._subprocess_env
             )
             
             # Stream output in real-time
@@ -267,28 +488,16 @@ class SetupManager:
                         break
                     if output.strip():
                         line = output.strip()
-                        # Color code different types of output
-                        if any(keyword in line for keyword in ["Collecting", "Found existing installation"]):
-                            print(f"{Colors.BLUE}🔍 {line}{Colors.RESET}")
-                        elif any(keyword in line for keyword in ["Downloading", "%", "progress"]):
-                            print(f"{Colors.CYAN}⬇️  {line}{Colors.RESET}")
-                        elif any(keyword in line for keyword in ["Installing", "added", "packages"]):
-                            print(f"{Colors.GREEN}📦 {line}{Colors.RESET}")
-                        elif any(keyword in line for keyword in ["Successfully installed", "up to date"]):
-                            print(f"{Colors.GREEN}✅ {line}{Colors.RESET}")
-                        elif any(keyword in line.lower() for keyword in ["error", "failed", "warn"]):
-                            print(f"{Colors.RED}❌ {line}{Colors.RESET}")
-                        elif "Requirement already satisfied" in line:
-                            print(f"{Colors.YELLOW}✓ {line}{Colors.RESET}")
-                        else:
-                            print(f"   {line}")
+                        if output_lines is not None:
+                            output_lines.append(line)
+                        self._print_install_line(line)
             
             # Wait for process to complete and get return code
             process.wait()
             return process.returncode == 0
                     
         except Exception as e:
-            print(f"{Colors.RED}❌ Live output failed: {e}{Colors.RESET}")
+            self._print(f"{Colors.RED}❌ Live output failed: {e}{Colors.RESET}")
             return False
 
     def install_python_dependencies(self):
@@ -298,15 +507,38 @@ class SetupManager:
         # Try requirements.txt first
         requirements_file = self.project_root / "requirements.txt"
         if requirements_file.exists():
-            print("Installing dependencies from requirements.txt...")
-            print(f"{Colors.YELLOW}   (This may take a few minutes, especially for torch/transformers){Colors.RESET}")
+            # Skip pip entirely if this exact requirements.txt was installed before
+            stamp_file = self.venv_path / ".requirements.sha256"
+            requirements_hash = hashlib.sha256(requirements_file.read_bytes()).hexdigest()
+            stamp = stamp_file.read_text().strip() if stamp_file.exists() else ""
+            if stamp == requirements_hash:
+                self.print_success("Requirements unchanged, skipping pip install")
+                return
             
+            self._print("Installing dependencies from requirements.txt...")
+            self._print(f"{Colors.YELLOW}   (This may take a few minutes, especially for torch/transformers){Colors.RESET}")
+            
+            # Wheels only first; no sdist builds means no isolated build environments
+            output_lines: deque = deque(maxlen=200)
             success = self._install_with_live_output([
-                str(self.venv_pip), "install", "-r", str(requirements_file), 
-                "--progress-bar", "on"
-            ], "Running: pip install -r requirements.txt")
+                *self._pip_install_prefix, "--only-binary=:all:", "-r", str(requirements_file)
+            ], "Running: pip install -r requirements.txt", output_lines=output_lines)
+            
+            if not success:
+                output = "\n".join(output_lines)
+                if PIP_NETWORK_ERROR_RE.search(output):
+                    # Every fallback would hit the same unreachable index
+                    self.print_error("pip could not reach the package index, check your network connection and re-run setup")
+                    return
+                # Only a missing wheel is worth a second run with source builds allowed
+                if UNSATISFIED_REQUIREMENT_RE.search(output):
+                    self.print_warning("Some packages have no compatible wheel, retrying with source builds allowed")
+                    success = self._install_with_live_output([
+                        *self._pip_install_prefix, "-r", str(requirements_file)
+                    ], "Running: pip install -r requirements.txt")
             
             if success:
+                stamp_file.write_text(requirements_hash)
                 self.print_success("Python dependencies installed from requirements.txt")
                 return
             else:
@@ -318,9 +550,12 @@ class SetupManager:
             "uvicorn[standard]>=0.24.0", 
             "pydantic>=2.5.0",
             "python-dotenv>=1.0.0",
+            "cachetools>=5.3.0",
+            "orjson>=3.9.0",
+            "tenacity>=8.2.0",
             "transformers>=4.35.0",
             "torch>=2.1.0",
-            "requests>=2.31.0",
+            "httpx[http2]>=0.25.0",
             "pytest>=7.4.0",
             "pytest-cov>=4.1.0",
             "black>=23.10.0",
@@ -328,19 +563,95 @@ class SetupManager:
             "flake8>=6.1.0"
         ]
         
-        print("Installing Python packages individually...")
+        # One pip run resolves the whole set at once instead of one process per package
+        self._print("Installing Python packages...")
+        # pip reports unresolvable requirements at the end, so the tail is enough
+        output_lines: deque = deque(maxlen=200)
+        success = self._install_with_live_output([
+            *self._pip_install_prefix, *packages
+        ], f"Installing {len(packages)} packages", output_lines=output_lines)
+        
+        if not success:
+            # pip aborts the whole batch on an unresolvable requirement, so install
+            # the rest together and only retry the reported ones individually
+            failed, remaining = self._split_unresolved(packages, output_lines)
+            
+            if failed and remaining:
+                self.print_warning(f"Could not resolve {', '.join(failed)}, installing the other packages")
+                if not self._install_with_live_output([
+                    *self._pip_install_prefix, *remaining
+                ], f"Installing {len(remaining)} packages"):
+                    # Retry the rest one by one too, so no package is silently skipped
+                    failed = packages
+            else:
+                failed = packages
+            
+            self._print("Retrying failed packages individually...")
+            self._install_individually(failed)
+        
+        self.print_success("Python dependencies installation completed")
+    
+    def _split_unresolved(self, packages: List[str], output_lines) -> Tuple[List[str], List[str]]:
+        """Split packages into those pip reported as unresolvable and the rest"""
+        unresolved = set(UNSATISFIED_REQUIREMENT_RE.findall("\n".join(output_lines)))
+        failed = [package for package in packages if package in unresolved]
+        remaining = [package for package in packages if package not in unresolved]
+        return failed, remaining
+    
+    def _install_individually(self, packages: List[str]):
+        """Install packages one at a time through a single long-lived pip process"""
+        worker = None
+        try:
+            worker = subprocess.Popen(
+                [self.venv_python_s, "-u", "-c", PIP_WORKER_SOURCE],
+                cwd=self.project_root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                env=self._subprocess_env
+            )
+        except OSError as e:
+            self.print_warning(f"Could not start pip worker ({e}), using a pip process per package")
+        
         for i, package in enumerate(packages, 1):
-            print(f"{Colors.BLUE}[{i}/{len(packages)}] Installing {package}...{Colors.RESET}")
-            success = self._install_with_live_output([
-                str(self.venv_pip), "install", package, "--progress-bar", "on"
-            ], f"Installing {package}")
+            self._print(f"{Colors.BLUE}[{i}/{len(packages)}] Installing {package}...{Colors.RESET}")
+            
+            success = None
+            if worker is not None:
+                success = self._run_pip_worker_command(worker, [*self._pip_install_prefix[1:], package])
+                if success is None:
+                    self.print_warning("pip worker exited, using a pip process per package")
+                    worker = None
+            if success is None:
+                success = self._install_with_live_output([
+                    *self._pip_install_prefix, package
+                ], f"Installing {package}")
             
             if success:
-                print(f"{Colors.GREEN}  ✓ {package} installed successfully{Colors.RESET}")
+                self._print(f"{Colors.GREEN}  ✓ {package} installed successfully{Colors.RESET}")
             else:
-                print(f"{Colors.RED}  ✗ Failed to install {package}{Colors.RESET}")
+                self._print(f"{Colors.RED}  ✗ Failed to install {package}{Colors.RESET}")
         
-        self.print_success("Python dependencies installation completed")
+        if worker is not None:
+            worker.stdin.close()
+            worker.wait()
+    
+    def _run_pip_worker_command(self, worker: subprocess.Popen, args: List[str]) -> Optional[bool]:
+        """Run one pip command in the worker; None if the worker is no longer usable"""
+        try:
+            worker.stdin.write(json.dumps(args) + "\n")
+            worker.stdin.flush()
+            for output in worker.stdout:
+                line = output.strip()
+                if line.startswith(PIP_WORKER_DONE_MARKER):
+                    return line[len(PIP_WORKER_DONE_MARKER):].strip() == "0"
+                if line:
+                    self._print_install_line(line)
+        except OSError:
+            pass
+        return None
     
     def setup_frontend_dependencies(self):
         """Set up frontend dependencies"""
@@ -359,17 +670,17 @@ class SetupManager:
             # List what's actually in the directory for debugging
             try:
                 files = [f.name for f in frontend_path.iterdir() if f.is_file()]
-                print(f"{Colors.YELLOW}📁 Files found: {files[:10]}{'...' if len(files) > 10 else ''}{Colors.RESET}")
+                self._print(f"{Colors.YELLOW}📁 Files found: {files[:10]}{'...' if len(files) > 10 else ''}{Colors.RESET}")
             except Exception:
                 pass
             return
         
         # Get the correct npm command
         npm_cmd = self._get_npm_command()
-        print(f"{Colors.CYAN}🔍 Using npm command: {' '.join(npm_cmd)}{Colors.RESET}")
+        self._print(f"{Colors.CYAN}🔍 Using npm command: {' '.join(npm_cmd)}{Colors.RESET}")
         
-        print("Installing Node.js dependencies...")
-        print(f"{Colors.CYAN}📂 Working in: {frontend_path}{Colors.RESET}")
+        self._print("Installing Node.js dependencies...")
+        self._print(f"{Colors.CYAN}📂 Working in: {frontend_path}{Colors.RESET}")
         
         # Try with live output first
         success = self._install_with_live_output(
@@ -380,7 +691,7 @@ class SetupManager:
         
         # If live output fails, try with regular command execution
         if not success:
-            print(f"{Colors.YELLOW}⚠️ Live output failed, trying standard npm install...{Colors.RESET}")
+            self._print(f"{Colors.YELLOW}⚠️ Live output failed, trying standard npm install...{Colors.RESET}")
             try:
                 self.run_command(npm_cmd + ["install"], cwd=frontend_path, capture_output=False)
                 self.print_success("Frontend dependencies installed")
@@ -388,14 +699,20 @@ class SetupManager:
                 self.print_error(f"Failed to install frontend dependencies: {e}")
                 self.print_info("Try running 'npm install' manually in the frontend directory")
                 # Additional troubleshooting info
-                print(f"{Colors.YELLOW}💡 Troubleshooting:{Colors.RESET}")
-                print("   • Make sure Node.js is installed: https://nodejs.org/")
-                print("   • Restart your terminal/command prompt after installing Node.js")
-                print("   • Check if npm is in PATH: run 'npm --version' manually")
+                self._print(f"{Colors.YELLOW}💡 Troubleshooting:{Colors.RESET}")
+                self._print("   • Make sure Node.js is installed: https://nodejs.org/")
+                self._print("   • Restart your terminal/command prompt after installing Node.js")
+                self._print("   • Check if npm is in PATH: run 'npm --version' manually")
                 sys.exit(1)
         else:
             self.print_success("Frontend dependencies installed")
     
+    def _copy_template(self, src: Path, dst: Path):
+        """Copy a small template file's contents without its metadata, replacing dst atomically"""
+        tmp = dst.with_name(dst.name + ".tmp")
+        tmp.write_bytes(src.read_bytes())
+        os.replace(tmp, dst)
+    
     def setup_environment_files(self):
         """Set up environment configuration files"""
         self.print_step(5, "Setting up Environment Files")
@@ -405,8 +722,8 @@ class SetupManager:
         server_env_example = self.project_root / "server" / ".env.example"
         
         if not server_env.exists() and server_env_example.exists():
-            print("Creating server/.env file from template...")
-            shutil.copy2(server_env_example, server_env)
+            self._print("Creating server/.env file from template...")
+            self._copy_template(server_env_example, server_env)
             self.print_success("Server .env file created")
         elif server_env.exists():
             self.print_warning("Server .env file already exists, skipping")
@@ -418,37 +735,72 @@ class SetupManager:
         frontend_env_example = self.project_root / "frontend" / ".env.local.example"
         
         if not frontend_env.exists() and frontend_env_example.exists():
-            print("Creating frontend/.env.local file from template...")
-            shutil.copy2(frontend_env_example, frontend_env)
+            self._print("Creating frontend/.env.local file from template...")
+            self._copy_template(frontend_env_example, frontend_env)
             self.print_success("Frontend .env.local file created")
         elif frontend_env.exists():
             self.print_warning("Frontend .env.local file already exists, skipping")
         else:
             self.print_error("Frontend .env.local.example not found")
     
+    def _venv_site_packages(self) -> Optional[Path]:
+        """Locate the virtual environment's site-packages directory"""
+        if self.system == "windows":
+            site_packages = self.venv_path / "Lib" / "site-packages"
+            return site_packages if site_packages.exists() else None
+        return next((self.venv_path / "lib").glob("python*/site-packages"), None)
+    
+    def _frontend_build_hash(self, frontend_path: Path) -> str:
+        """Hash the inputs that decide whether a previous frontend build is still valid"""
+        digest = hashlib.sha256()
+        for name in ("package.json", "package-lock.json"):
+            try:
+                with open(frontend_path / name, "rb") as f:
+                    digest.update(hashlib.file_digest(f, "sha256").digest())
+            except OSError:
+                digest.update(b"missing")
+        node_version = self.get_cached_version(["node", "--version"], "node") or ""
+        digest.update(node_version.encode())
+        return digest.hexdigest()
+    
     def test_installation(self):
         """Test the installation"""
         self.print_step(6, "Testing Installation")
         
         # Test server dependencies
-        print("Testing server dependencies...")
-        try:
-            test_code = "import fastapi, uvicorn, pydantic; print('Server dependencies OK')"
-            result = self.run_command([str(self.venv_python), "-c", test_code])
-            if "Server dependencies OK" in result.stdout:
-                self.print_success("Server dependencies working")
-            else:
-                self.print_warning("Server dependencies test unclear")
-        except subprocess.CalledProcessError:
-            self.print_error("Server dependencies test failed")
+        self._print("Testing server dependencies...")
+        # Look for installed distributions on disk instead of starting the venv interpreter
+        site_packages = self._venv_site_packages()
+        missing = [
+            package for package in ("fastapi", "uvicorn", "pydantic")
+            if site_packages is None or not any(site_packages.glob(f"{package}-*.dist-info"))
+        ]
+        if not missing:
+            self.print_success("Server dependencies working")
+        else:
+            self.print_error(f"Server dependencies test failed, missing: {', '.join(missing)}")
         
         # Test frontend build
-        print("Testing frontend build...")
+        self._print("Testing frontend build...")
+        frontend_path = self.project_root / "frontend"
+        build_cache_file = frontend_path / ".next" / ".setup-build-cache.json"
+        build_hash = self._frontend_build_hash(frontend_path)
+        try:
+            if json.loads(build_cache_file.read_text()).get("hash") == build_hash:
+                self.print_success("Frontend build cached, skipping")
+                return
+        except (OSError, ValueError):
+            pass
+        
         try:
-            frontend_path = self.project_root / "frontend"
             npm_cmd = self._get_npm_command()
-            result = self.run_command(npm_cmd + ["run", "build"], cwd=frontend_path)
+            # Stream the build log to the terminal instead of buffering it
+            self.run_command(npm_cmd + ["run", "build"], cwd=frontend_path, capture_output=False)
             self.print_success("Frontend build test passed")
+            try:
+                build_cache_file.write_text(json.dumps({"hash": build_hash, "ts": time.time()}))
+            except OSError:
+                pass
         except subprocess.CalledProcessError:
             self.print_error("Frontend build test failed")
             self.print_info("Check the console output above for specific errors")
@@ -457,91 +809,122 @@ class SetupManager:
         """Print setup completion message"""
         self.print_step(7, "Setup Complete!")
         
-        print(f"{Colors.GREEN}🎉 Setup completed successfully!{Colors.RESET}\n")
+        # Collect the whole message and emit it with a single write
+        lines = []
         
-        print(f"{Colors.YELLOW}📋 Next Steps:{Colors.RESET}\n")
+        lines.append(f"{Colors.GREEN}🎉 Setup completed successfully!{Colors.RESET}\n")
         
-        print(f"{Colors.YELLOW}1. Configure API Keys:{Colors.RESET}")
-        print("   📝 Get your Hugging Face tokens:")
-        print("      • Visit: https://huggingface.co/settings/tokens")
-        print("      • Create a new token with read access")
-        print("      • Copy the token\n")
+        lines.append(f"{Colors.YELLOW}📋 Next Steps:{Colors.RESET}\n")
         
-        print("   📝 Update server/.env file:")
-        print("      • Set HF_TOKEN_PRED=your-huggingface-token")
-        print("      • Set HF_TOKEN_GEN=your-huggingface-token")
-        print("      • Set API_KEY=your-secure-api-key-here\n")
+        lines.append(f"{Colors.YELLOW}1. Configure API Keys:{Colors.RESET}")
+        lines.append("   📝 Get your Hugging Face tokens:")
+        lines.append("      • Visit: https://huggingface.co/settings/tokens")
+        lines.append("      • Create a new token with read access")
+        lines.append("      • Copy the token\n")
         
-        print("   📝 Update frontend/.env.local file:")
-        print("      • Set NEXT_PUBLIC_API_KEY=your-secure-api-key-here")
-        print("      • (Must match the API_KEY in server/.env)\n")
+        lines.append("   📝 Update server/.env file:")
+        lines.append("      • Set HF_TOKEN_PRED=your-huggingface-token")
+        lines.append("      • Set HF_TOKEN_GEN=your-huggingface-token")
+        lines.append("      • Set API_KEY=your-secure-api-key-here\n")
         
-        print(f"{Colors.YELLOW}2. Start the Application:{Colors.RESET}")
-        print("   📝 Terminal 1 - Start the server:")
+        lines.append("   📝 Update frontend/.env.local file:")
+        lines.append("      • Set NEXT_PUBLIC_API_KEY=your-secure-api-key-here")
+        lines.append("      • (Must match the API_KEY in server/.env)\n")
+        
+        lines.append(f"{Colors.YELLOW}2. Start the Application:{Colors.RESET}")
+        lines.append("   📝 Terminal 1 - Start the server:")
         if self.system == "windows":
-            print("      cd server")
-            print("      ..\\venv\\Scripts\\activate.bat")
-            print("      python server.py\n")
+            lines.append("      cd server")
+            lines.append("      ..\\venv\\Scripts\\activate.bat")
+            lines.append("      python server.py\n")
         else:
-            print("      cd server")
-            print("      source ../venv/bin/activate")
-            print("      python server.py\n")
-        
-        print("   📝 Terminal 2 - Start the frontend:")
-        print("      cd frontend")
-        print("      npm run dev\n")
-        
-        print(f"{Colors.YELLOW}3. Access the Application:{Colors.RESET}")
-        print("   🌐 Frontend: http://localhost:3000")
-        print("   🔧 API Docs: http://localhost:8000/docs")
-        print("   💚 Health Check: http://localhost:8000/api/health\n")
-        
-        print(f"{Colors.YELLOW}4. Development:{Colors.RESET}")
-        print("   📚 Read the documentation:")
-        print("      • README.md - Project overview")
-        print("      • DEVELOPER_GUIDE.md - Development guide")
-        print("      • server/README.md - Server documentation")
-        print("      • frontend/README.md - Frontend documentation\n")
-        
-        print(f"{Colors.CYAN}💡 Tips:{Colors.RESET}")
+            lines.append("      cd server")
+            lines.append("      source ../venv/bin/activate")
+            lines.append("      python server.py\n")
+        
+        lines.append("   📝 Terminal 2 - Start the frontend:")
+        lines.append("      cd frontend")
+        lines.append("      npm run dev\n")
+        
+        lines.append(f"{Colors.YELLOW}3. Access the Application:{Colors.RESET}")
+        lines.append("   🌐 Frontend: http://localhost:3000")
+        lines.append("   🔧 API Docs: http://localhost:8000/docs")
+        lines.append("   💚 Health Check: http://localhost:8000/api/health\n")
+        
+        lines.append(f"{Colors.YELLOW}4. Development:{Colors.RESET}")
+        lines.append("   📚 Read the documentation:")
+        lines.append("      • README.md - Project overview")
+        lines.append("      • DEVELOPER_GUIDE.md - Development guide")
+        lines.append("      • server/README.md - Server documentation")
+        lines.append("      • frontend/README.md - Frontend documentation\n")
+        
+        lines.append(f"{Colors.CYAN}💡 Tips:{Colors.RESET}")
         if self.system == "windows":
-            print("   • Always activate the virtual environment: venv\\Scripts\\activate.bat")
+            lines.append("   • Always activate the virtual environment: venv\\Scripts\\activate.bat")
         else:
-            print("   • Always activate the virtual environment: source venv/bin/activate")
-        print("   • Check the logs if something doesn't work")
-        print("   • Environment variables require server restart to take effect")
-        print("   • Use 'deactivate' to exit the virtual environment\n")
+            lines.append("   • Always activate the virtual environment: source venv/bin/activate")
+        lines.append("   • Check the logs if something doesn't work")
+        lines.append("   • Environment variables require server restart to take effect")
+        lines.append("   • Use 'deactivate' to exit the virtual environment\n")
+        
+        lines.append(f"{Colors.GREEN}🚀 Happy coding!{Colors.RESET}")
         
-        print(f"{Colors.GREEN}🚀 Happy coding!{Colors.RESET}")
+        self._write("\n".join(lines) + "\n")
     
     def run_setup(self):
         """Run the complete setup process"""
-        print(f"{Colors.MAGENTA}🚀 ScamSimAI - Automated Setup{Colors.RESET}")
-        print(f"{Colors.MAGENTA}=============================={Colors.RESET}")
+        self._print(f"{Colors.MAGENTA}🚀 ScamSimAI - Automated Setup{Colors.RESET}")
+        self._print(f"{Colors.MAGENTA}=============================={Colors.RESET}")
         
         try:
             self.check_system_requirements()
             self.setup_virtual_environment()
-            self.install_python_dependencies()
-            self.setup_frontend_dependencies()
-            self.setup_environment_files()
+            
+            # pip, npm and the env file copies are independent, so run them side by side.
+            # The long pip stage streams live; npm and env output is short, so it is
+            # buffered and printed after pip to keep the steps from interleaving.
+            self._print(f"\n{Colors.CYAN}⏳ Installing frontend dependencies in the background, "
+                        f"their output follows the Python dependencies...{Colors.RESET}")
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                python_future = executor.submit(self.install_python_dependencies)
+                buffered_futures = [
+                    executor.submit(self._run_buffered, self.setup_frontend_dependencies),
+                    executor.submit(self._run_buffered, self.setup_environment_files),
+                ]
+            results = [future.result() for future in buffered_futures]
+            for output, _ in results:
+                self._write(output)
+            # Re-raise the first failure (including sys.exit) in step order
+            python_future.result()
+            for _, error in results:
+                if error is not None:
+                    raise error
+            
             self.test_installation()
             self.print_completion_message()
         except KeyboardInterrupt:
-            print(f"\n{Colors.YELLOW}⚠️ Setup interrupted by user{Colors.RESET}")
+            self._print(f"\n{Colors.YELLOW}⚠️ Setup interrupted by user{Colors.RESET}")
             sys.exit(1)
         except Exception as e:
-            print(f"\n{Colors.RED}❌ Setup failed with error: {e}{Colors.RESET}")
+            self._print(f"\n{Colors.RED}❌ Setup failed with error: {e}{Colors.RESET}")
             sys.exit(1)
 
 def main():
     """Main entry point"""
+    parser = argparse.ArgumentParser(description="ScamSimAI automated setup")
+    parser.add_argument(
+        "--no-syscheck-cache",
+        action="store_true",
+        help=f"Re-check node/npm versions instead of using {SYSCHECK_CACHE_FILE}"
+    )
+    args = parser.parse_args()
+    
     # Change to script directory
     script_dir = Path(__file__).parent.absolute()
     os.chdir(script_dir)
     
     # Create and run setup manager
-    setup_manager = SetupManager()
+    setup_manager = SetupManager(use_syscheck_cache=not args.no_syscheck_cache)
     setup_manager.run_setup()
 
 if __name__ == "__main__":
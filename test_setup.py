@@ -0,0 +1,376 @@
+import pytest
+
+import setup
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """A SetupManager working in a temporary project with its own syscheck cache"""
+    monkeypatch.setattr(setup, "SYSCHECK_CACHE_FILE", tmp_path / "syscheck.json")
+    manager = setup.SetupManager()
+    manager.project_root = tmp_path
+    manager.venv_path = tmp_path / "venv"
+    return manager
+
+
+class FakeInstaller:
+    """Records pip runs and replays canned results and output"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.commands = []
+
+    def __call__(self, command, description, cwd=None, output_lines=None):
+        self.commands.append(command)
+        success, output = self.results.pop(0)
+        if output_lines is not None:
+            output_lines.extend(output.splitlines())
+        return success
+
+
+def install(manager, monkeypatch, installer):
+    """Run the Python dependency install with pip replaced, returning the individually retried packages"""
+    retried = []
+    monkeypatch.setattr(manager, "_install_with_live_output", installer)
+    monkeypatch.setattr(manager, "_install_individually", retried.extend)
+    manager.install_python_dependencies()
+    return retried
+
+
+@pytest.fixture
+def requirements(manager, tmp_path):
+    """Requirements file in the temporary project"""
+    requirements = tmp_path / "requirements.txt"
+    requirements.write_text("fastapi>=0.104.0\n")
+    manager.venv_path.mkdir()
+    return requirements
+
+
+class TestFallbackInstall:
+    PACKAGES = ["fastapi>=0.104.0", "uvicorn[standard]>=0.24.0", "torch>=2.1.0"]
+
+    def test_split_unresolved(self, manager):
+        """Test only the requirements pip reported are split off"""
+        output = [
+            "ERROR: Could not find a version that satisfies the requirement torch>=2.1.0 (from versions: none)",
+            "ERROR: No matching distribution found for torch>=2.1.0"
+        ]
+        assert manager._split_unresolved(self.PACKAGES, output) == (
+            ["torch>=2.1.0"], ["fastapi>=0.104.0", "uvicorn[standard]>=0.24.0"]
+        )
+
+    def test_split_unresolved_with_extras(self, manager):
+        """Test requirements with extras are matched as written"""
+        output = ["ERROR: No matching distribution found for uvicorn[standard]>=0.24.0"]
+        assert manager._split_unresolved(self.PACKAGES, output) == (
+            ["uvicorn[standard]>=0.24.0"], ["fastapi>=0.104.0", "torch>=2.1.0"]
+        )
+
+    def test_split_unresolved_unrelated_failure(self, manager):
+        """Test a failure naming none of the packages splits nothing off"""
+        output = ["ERROR: No matching distribution found for sympy>=1.13", "network is unreachable"]
+        assert manager._split_unresolved(self.PACKAGES, output) == ([], self.PACKAGES)
+
+    def test_batch_success(self, manager, monkeypatch):
+        """Test a successful batch installs everything in one pip run"""
+        installer = FakeInstaller((True, ""))
+        assert install(manager, monkeypatch, installer) == []
+        assert len(installer.commands) == 1
+
+    def test_unresolved_retried_individually(self, manager, monkeypatch):
+        """Test the rest is installed together and only unresolved packages are retried"""
+        installer = FakeInstaller(
+            (False, "ERROR: No matching distribution found for torch>=2.1.0"),
+            (True, "")
+        )
+        retried = install(manager, monkeypatch, installer)
+        assert "torch>=2.1.0" not in installer.commands[1]
+        assert "fastapi>=0.104.0" in installer.commands[1]
+        assert retried == ["torch>=2.1.0"]
+
+    def test_failed_remaining_batch_retries_everything(self, manager, monkeypatch):
+        """Test a failed second batch sends every package to the individual retry"""
+        installer = FakeInstaller(
+            (False, "ERROR: No matching distribution found for torch>=2.1.0"),
+            (False, "")
+        )
+        retried = install(manager, monkeypatch, installer)
+        assert "torch>=2.1.0" in retried
+        assert "fastapi>=0.104.0" in retried
+
+    def test_unexplained_failure_retries_everything(self, manager, monkeypatch):
+        """Test a failure without unresolved requirements retries every package"""
+        installer = FakeInstaller((False, "network is unreachable"))
+        retried = install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 1
+        assert "fastapi>=0.104.0" in retried
+
+
+class TestSyscheckCache:
+    @pytest.fixture
+    def probe(self, manager, tmp_path, monkeypatch):
+        """Fake node binary whose version probes are counted"""
+        binary = tmp_path / "bin" / "node"
+        binary.parent.mkdir()
+        binary.write_text("#!/bin/sh\n")
+        probe = {"binary": binary, "calls": 0}
+        monkeypatch.setattr(setup.shutil, "which", lambda tool: str(probe["binary"]))
+
+        def get_version(command):
+            probe["calls"] += 1
+            return "v20.0.0"
+
+        monkeypatch.setattr(manager, "get_version", get_version)
+        return probe
+
+    def check(self, manager):
+        return manager.get_cached_version(["node", "--version"], "node")
+
+    def test_cache_hit(self, manager, probe):
+        """Test an unchanged binary is probed once, also across setup runs"""
+        assert self.check(manager) == "v20.0.0"
+        assert self.check(manager) == "v20.0.0"
+        manager._syscheck_cache = None
+        assert self.check(manager) == "v20.0.0"
+        assert probe["calls"] == 1
+
+    def test_mtime_change_invalidates(self, manager, probe):
+        """Test touching the binary forces a new probe"""
+        self.check(manager)
+        stat = probe["binary"].stat()
+        setup.os.utime(probe["binary"], (stat.st_atime, stat.st_mtime + 10))
+        self.check(manager)
+        assert probe["calls"] == 2
+
+    def test_inode_change_invalidates(self, manager, probe):
+        """Test a replaced binary with the same mtime forces a new probe"""
+        self.check(manager)
+        stat = probe["binary"].stat()
+        replacement = probe["binary"].with_name("node.new")
+        replacement.write_text("#!/bin/sh\n")
+        # Keep the old inode alive so the replacement cannot reuse its number
+        keep = probe["binary"].with_name("node.old")
+        setup.os.link(probe["binary"], keep)
+        setup.os.replace(replacement, probe["binary"])
+        setup.os.utime(probe["binary"], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.check(manager)
+        assert probe["calls"] == 2
+
+    def test_path_change_invalidates(self, manager, probe):
+        """Test a different binary on PATH forces a new probe"""
+        self.check(manager)
+        other = probe["binary"].with_name("node2")
+        other.write_text("#!/bin/sh\n")
+        probe["binary"] = other
+        self.check(manager)
+        assert probe["calls"] == 2
+
+    def test_ttl_expiry(self, manager, probe, monkeypatch):
+        """Test entries older than the TTL are probed again"""
+        self.check(manager)
+        now = setup.time.time()
+        monkeypatch.setattr(setup.time, "time", lambda: now + setup.SYSCHECK_CACHE_TTL + 1)
+        self.check(manager)
+        assert probe["calls"] == 2
+
+    def test_expired_entries_pruned(self, manager, probe):
+        """Test saving the cache drops entries older than the TTL"""
+        setup.SYSCHECK_CACHE_FILE.write_text(setup.json.dumps({
+            "stale:node --version": {"checked_at": 0},
+            "fresh:node --version": {"checked_at": setup.time.time()}
+        }))
+        self.check(manager)
+        cache = setup.json.loads(setup.SYSCHECK_CACHE_FILE.read_text())
+        assert "stale:node --version" not in cache
+        assert "fresh:node --version" in cache
+        assert len(cache) == 2
+
+    def test_cache_disabled(self, manager, probe):
+        """Test --no-syscheck-cache always probes"""
+        manager.use_syscheck_cache = False
+        self.check(manager)
+        self.check(manager)
+        assert probe["calls"] == 2
+        assert not setup.SYSCHECK_CACHE_FILE.exists()
+
+
+class TestFrontendBuildCache:
+    @pytest.fixture
+    def builds(self, manager, tmp_path, monkeypatch):
+        """Fake frontend project whose npm builds are recorded instead of run"""
+        frontend = tmp_path / "frontend"
+        frontend.mkdir()
+        (frontend / "package.json").write_text('{"name": "frontend"}')
+        (frontend / "package-lock.json").write_text("{}")
+        builds = {"count": 0, "fail": False, "node": "v20.0.0"}
+
+        def run_command(command, cwd=None, capture_output=True, check=True):
+            builds["count"] += 1
+            if builds["fail"]:
+                raise setup.subprocess.CalledProcessError(1, command)
+            (frontend / ".next").mkdir(exist_ok=True)
+
+        monkeypatch.setattr(manager, "run_command", run_command)
+        monkeypatch.setattr(manager, "get_cached_version", lambda command, tool: builds["node"])
+        return builds
+
+    def test_unchanged_inputs_skip_build(self, manager, builds):
+        """Test a second run with the same inputs skips the build"""
+        manager.test_installation()
+        manager.test_installation()
+        assert builds["count"] == 1
+
+    def test_changed_package_json_rebuilds(self, manager, builds, tmp_path):
+        """Test editing package.json forces a rebuild"""
+        manager.test_installation()
+        (tmp_path / "frontend" / "package.json").write_text('{"name": "frontend", "version": "2"}')
+        manager.test_installation()
+        assert builds["count"] == 2
+
+    def test_changed_node_version_rebuilds(self, manager, builds):
+        """Test a different Node.js version forces a rebuild"""
+        manager.test_installation()
+        builds["node"] = "v22.0.0"
+        manager.test_installation()
+        assert builds["count"] == 2
+
+    def test_failed_build_not_cached(self, manager, builds, tmp_path):
+        """Test a failed build is retried on the next run"""
+        (tmp_path / "frontend" / ".next").mkdir()
+        builds["fail"] = True
+        manager.test_installation()
+        builds["fail"] = False
+        manager.test_installation()
+        assert builds["count"] == 2
+
+
+class TestRequirementsInstall:
+    def test_wheels_installed(self, manager, monkeypatch, requirements):
+        """Test a successful wheel-only run is the only pip run"""
+        installer = FakeInstaller((True, ""))
+        install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 1
+        assert "--only-binary=:all:" in installer.commands[0]
+
+    def test_missing_wheel_retries_with_source_builds(self, manager, monkeypatch, requirements):
+        """Test a missing wheel triggers one run with source builds allowed"""
+        installer = FakeInstaller(
+            (False, "ERROR: Could not find a version that satisfies the requirement fastapi>=0.104.0"),
+            (True, "")
+        )
+        install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 2
+        assert "--only-binary=:all:" not in installer.commands[1]
+
+    def test_other_failure_skips_source_build_retry(self, manager, monkeypatch, requirements):
+        """Test a failure that is not a missing wheel goes straight to the package fallback"""
+        installer = FakeInstaller((False, "ERROR: ResolutionImpossible"), (True, ""))
+        install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 2
+        assert str(requirements) not in installer.commands[1]
+
+    def test_offline_stops_after_one_run(self, manager, monkeypatch, requirements):
+        """Test an unreachable index is reported without any fallback pip runs"""
+        installer = FakeInstaller((False, "\n".join([
+            "WARNING: Retrying after connection broken by 'NewConnectionError': Failed to establish a new connection",
+            "ERROR: Could not find a version that satisfies the requirement fastapi>=0.104.0 (from versions: none)"
+        ])))
+        retried = install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 1
+        assert retried == []
+        assert not (manager.venv_path / ".requirements.sha256").exists()
+
+
+class TestRequirementsStamp:
+    def stamp(self, manager):
+        return manager.venv_path / ".requirements.sha256"
+
+    def test_stamp_written_after_install(self, manager, monkeypatch, requirements):
+        """Test a successful install records the requirements hash"""
+        install(manager, monkeypatch, FakeInstaller((True, "")))
+        assert self.stamp(manager).read_text() == setup.hashlib.sha256(requirements.read_bytes()).hexdigest()
+
+    def test_unchanged_requirements_skip_pip(self, manager, monkeypatch, requirements):
+        """Test a matching stamp skips pip entirely"""
+        install(manager, monkeypatch, FakeInstaller((True, "")))
+        installer = FakeInstaller()
+        install(manager, monkeypatch, installer)
+        assert installer.commands == []
+
+    def test_changed_requirements_reinstall(self, manager, monkeypatch, requirements):
+        """Test editing requirements.txt runs pip again and updates the stamp"""
+        install(manager, monkeypatch, FakeInstaller((True, "")))
+        requirements.write_text("fastapi>=0.110.0\n")
+        installer = FakeInstaller((True, ""))
+        install(manager, monkeypatch, installer)
+        assert len(installer.commands) == 1
+        assert self.stamp(manager).read_text() == setup.hashlib.sha256(requirements.read_bytes()).hexdigest()
+
+    def test_failed_install_not_stamped(self, manager, monkeypatch, requirements):
+        """Test a failed install leaves no stamp, so the next run installs again"""
+        install(manager, monkeypatch, FakeInstaller((False, "ERROR: ResolutionImpossible"), (True, "")))
+        assert not self.stamp(manager).exists()
+
+
+class TestNpmVersion:
+    @pytest.fixture
+    def npm_at(self, monkeypatch):
+        """Point shutil.which at a given npm binary"""
+        def npm_at(path):
+            monkeypatch.setattr(setup.shutil, "which", lambda tool: str(path))
+        return npm_at
+
+    def write_package(self, directory, name="npm", version="10.8.2"):
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "package.json").write_text(setup.json.dumps({"name": name, "version": version}))
+
+    def test_unix_symlink_layout(self, manager, tmp_path, npm_at):
+        """Test a symlink into the npm package resolves to its package.json"""
+        package = tmp_path / "lib" / "node_modules" / "npm"
+        self.write_package(package)
+        (package / "bin").mkdir()
+        (package / "bin" / "npm-cli.js").write_text("")
+        link = tmp_path / "shims" / "npm"
+        link.parent.mkdir()
+        try:
+            link.symlink_to(package / "bin" / "npm-cli.js")
+        except OSError:
+            pytest.skip("symlinks not supported")
+        npm_at(link)
+        assert manager._npm_version_fast(["npm"]) == "10.8.2"
+
+    def test_unix_prefix_layout(self, manager, tmp_path, npm_at):
+        """Test a wrapper script in <prefix>/bin finds <prefix>/lib/node_modules/npm"""
+        self.write_package(tmp_path / "lib" / "node_modules" / "npm")
+        (tmp_path / "bin").mkdir()
+        (tmp_path / "bin" / "npm").write_text("#!/bin/sh\n")
+        npm_at(tmp_path / "bin" / "npm")
+        assert manager._npm_version_fast(["npm"]) == "10.8.2"
+
+    def test_windows_layout(self, manager, tmp_path, npm_at):
+        """Test npm.cmd next to node_modules in the Node.js install directory"""
+        self.write_package(tmp_path / "nodejs" / "node_modules" / "npm")
+        (tmp_path / "nodejs" / "npm.cmd").write_text("")
+        npm_at(tmp_path / "nodejs" / "npm.cmd")
+        assert manager._npm_version_fast(["npm.cmd"]) == "10.8.2"
+
+    def test_other_package_ignored(self, manager, tmp_path, npm_at):
+        """Test a package.json that is not npm's is not trusted"""
+        self.write_package(tmp_path / "nodejs" / "node_modules" / "npm", name="not-npm")
+        (tmp_path / "nodejs" / "npm.cmd").write_text("")
+        npm_at(tmp_path / "nodejs" / "npm.cmd")
+        assert manager._npm_version_fast(["npm.cmd"]) is None
+
+    def test_falls_back_to_subprocess(self, manager, tmp_path, npm_at, monkeypatch):
+        """Test npm --version is only run when no package.json can be read"""
+        (tmp_path / "bin").mkdir()
+        (tmp_path / "bin" / "npm").write_text("#!/bin/sh\n")
+        npm_at(tmp_path / "bin" / "npm")
+        probes = []
+        monkeypatch.setattr(manager, "get_cached_version", lambda command, tool: probes.append(command) or "9.0.0")
+        assert manager.get_npm_version(["npm"]) == "9.0.0"
+        assert probes == [["npm", "--version"]]
+
+        self.write_package(tmp_path / "lib" / "node_modules" / "npm")
+        assert manager.get_npm_version(["npm"]) == "10.8.2"
+        assert len(probes) == 1